@@ -0,0 +1,117 @@
+"""Concurrent write workload against the configured engine profile.
+
+Each worker runs the handler-style write transactions (lock toggles, role
+add/remove, user upserts, install logs) through writer.run(). Run from the
+repository root; --baseline clears the SQLite pragmas to compare against the
+untuned defaults and --single-writer batches all writes through one task:
+
+    python bench/db_write.py --workers 32 --ops 200
+    python bench/db_write.py --workers 32 --ops 200 --baseline
+    python bench/db_write.py --workers 32 --ops 200 --single-writer
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--workers", type=int, default=32)
+parser.add_argument("--ops", type=int, default=200, help="transactions per worker")
+parser.add_argument("--groups", type=int, default=50)
+parser.add_argument("--users", type=int, default=500)
+parser.add_argument("--baseline", action="store_true", help="run without the SQLite pragmas")
+parser.add_argument("--single-writer", action="store_true", help="route writes through the single writer task")
+parser.add_argument("--url", help="database URL (default: temporary SQLite file)")
+args = parser.parse_args()
+
+DB_DIR = tempfile.TemporaryDirectory(prefix="nion-dbwrite-")
+os.environ["DATABASE_URL"] = args.url or f"sqlite+aiosqlite:///{DB_DIR.name}/bench.db"
+if args.baseline:
+    for name in ("JOURNAL_MODE", "SYNCHRONOUS", "BUSY_TIMEOUT", "MMAP_SIZE", "CACHE_SIZE"):
+        os.environ[f"SQLITE_{name}"] = ""
+os.environ["DB_SINGLE_WRITER"] = "1" if args.single_writer else "0"
+
+from sqlalchemy.exc import OperationalError
+
+from database import crud, engine, init_db, models
+from database.session import write_session
+from database.config import BACKEND, SQLITE_PRAGMAS
+from database.writer import writer
+
+
+async def seed() -> None:
+    await init_db()
+    async with write_session() as session:
+        session.add_all(
+            models.User(chat_id=f"b0user{i}", user_id=f"u0user{i}", username=f"user{i}") for i in range(args.users)
+        )
+        await session.flush()
+        session.add_all(
+            models.Group(chat_id=f"g0group{i}", title=f"group {i}", owner_id=f"b0user{i % args.users}")
+            for i in range(args.groups)
+        )
+
+
+async def toggle_admin(session, group_id: str, user_id: str) -> None:
+    if not await crud.remove_group_role(session, group_id, user_id, "admin"):
+        await crud.ensure_group_role(session, group_id, user_id, "admin")
+
+
+async def write_once(rng: random.Random) -> None:
+    group_id = f"g0group{rng.randrange(args.groups)}"
+    user = rng.randrange(args.users)
+    kind = rng.randrange(4)
+    if kind == 0:
+        await writer.run(crud.update_group_locks, group_id, link_lock=rng.random() < 0.5)
+    elif kind == 1:
+        await writer.run(toggle_admin, group_id, f"u0user{user}")
+    elif kind == 2:
+        await writer.run(crud.upsert_user, f"b0user{user}", f"u0user{user}", f"user{user}_{rng.randrange(100)}")
+    else:
+        await writer.run(crud.install_group, group_id, f"group {group_id}", f"b0user{user}")
+
+
+async def worker(seed_value: int, latencies: list[float], errors: list[str]) -> None:
+    rng = random.Random(seed_value)
+    for _ in range(args.ops):
+        started = time.perf_counter()
+        try:
+            await write_once(rng)
+        except OperationalError as exc:
+            errors.append(str(exc.orig))
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run() -> None:
+    await seed()
+    writer.start()
+    latencies: list[float] = []
+    errors: list[str] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i, latencies, errors) for i in range(args.workers)))
+    elapsed = time.perf_counter() - started
+    await writer.stop()
+    latencies.sort()
+
+    pragmas = "defaults" if args.baseline else ", ".join(f"{k}={v}" for k, v in SQLITE_PRAGMAS.items() if v)
+    print(f"backend      {BACKEND} ({pragmas if BACKEND == 'sqlite' else engine.pool.status()})")
+    mode = f"single writer, {writer.batches} batches" if writer.enabled else "concurrent sessions"
+    print(f"committed    {len(latencies)} / {args.workers * args.ops}  errors {len(errors)}  ({mode})")
+    print(f"throughput   {len(latencies) / elapsed:.0f} tx/s over {elapsed:.2f}s")
+    if latencies:
+        print(f"latency      p50 {latencies[len(latencies) // 2] * 1000:.1f}ms  p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms")
+    for message in sorted(set(errors))[:3]:
+        print(f"error        {message}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,126 @@
+"""The joke feed against a local stub of the joke API: prefetch, breaker, fallback.
+
+Serves jokes from an aiohttp stub, then takes the stub down and brings it back,
+checking at each step that the feed answers from its buffer without waiting on
+upstream, stops calling a failing upstream once the breaker opens, falls back
+to jokes it has already seen, and lets exactly one probe through while
+half-open. Exits non-zero on the first check that fails. Run from the repository root:
+
+    python bench/joke_feed.py
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from joke import CircuitBreaker, JokeFeed
+
+BUFFER_SIZE = 5
+THRESHOLD = 3
+RESET = 0.5
+
+
+class Upstream:
+    def __init__(self):
+        self.up = True
+        self.delay = 0.0
+        self.requests = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        if not self.up:
+            return web.Response(status=503)
+        return web.json_response({"text": f"joke {self.requests}"})
+
+
+async def settle(condition, timeout: float = 2) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for the feed")
+        await asyncio.sleep(0.01)
+
+
+def check(label: str, ok: bool) -> None:
+    print(f"{'ok' if ok else 'FAIL':<6}{label}")
+    if not ok:
+        raise SystemExit(1)
+
+
+async def run() -> None:
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    check("a half-open breaker admits one caller", [breaker.allow() for _ in range(3)] == [True, False, False])
+
+    upstream = Upstream()
+    app = web.Application()
+    app.router.add_get("/joke/random", upstream.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    feed = JokeFeed(
+        url=f"http://127.0.0.1:{port}/joke/random",
+        buffer_size=BUFFER_SIZE,
+        timeout=1,
+        breaker=CircuitBreaker(threshold=THRESHOLD, reset_timeout=RESET),
+    )
+    try:
+        await feed.start()
+        await settle(lambda: len(feed.buffer) == BUFFER_SIZE)
+        check("prefetch fills the buffer", upstream.requests == BUFFER_SIZE)
+
+        started = time.perf_counter()
+        text = await feed.get()
+        elapsed = (time.perf_counter() - started) * 1e6
+        check(f"get() answers from the buffer ({elapsed:.0f} µs)", text == "joke 1")
+        await settle(lambda: len(feed.buffer) == BUFFER_SIZE)
+        check("prefetch tops the buffer up", upstream.requests == BUFFER_SIZE + 1)
+
+        upstream.up = False
+        # Each get() on an empty buffer wakes the prefetcher for one more attempt.
+        for _ in range(BUFFER_SIZE + THRESHOLD * 10):
+            if feed.breaker.opened_at is not None:
+                break
+            await feed.get()
+            await asyncio.sleep(0.01)
+        failed = upstream.requests
+        check(f"breaker opens after {THRESHOLD} failures", feed.breaker.failures >= THRESHOLD)
+
+        text = await feed.get()
+        await asyncio.sleep(0.05)
+        check("get() falls back to a joke already seen", text in feed.fallback)
+        check("an open breaker sends nothing upstream", upstream.requests == failed)
+
+        await asyncio.sleep(RESET)
+        for _ in range(10):
+            await feed.get()
+            await asyncio.sleep(0.01)
+        check("half-open lets a single probe through", upstream.requests == failed + 1)
+        check("a failed probe opens the breaker again", feed.breaker.opened_at is not None)
+
+        upstream.up = True
+        upstream.delay = 0.3
+        await asyncio.sleep(RESET)
+        started = time.perf_counter()
+        text = await feed.get()
+        elapsed = (time.perf_counter() - started) * 1e6
+        check(f"a miss answers stale while the probe runs ({elapsed:.0f} µs)", text in feed.fallback)
+        upstream.delay = 0
+        await settle(lambda: feed.breaker.opened_at is None and len(feed.buffer) == BUFFER_SIZE)
+        check("the probe closes the breaker and prefetch refills", True)
+    finally:
+        await feed.stop()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
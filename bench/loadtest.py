@@ -0,0 +1,239 @@
+"""Offline load test: replays synthetic updates through the real handlers.
+
+The handlers run against FakeBotClient (records API calls, simulates latency)
+and a throwaway SQLite database. Run from the repository root:
+
+    python bench/loadtest.py --updates 20000 --groups 200 --users 2000 --latency 20
+    python bench/loadtest.py --mix chatter=80,link=10,command=10 --rate 500
+    python bench/loadtest.py --api-rate 50 --chat-rate 1
+"""
+import argparse
+import asyncio
+import functools
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+os.chdir(ROOT)
+DB_DIR = tempfile.TemporaryDirectory(prefix="nion-loadtest-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_DIR.name}/loadtest.db"
+os.environ.setdefault("RATE_LIMIT", "0")
+os.environ.setdefault("BOT_TOKEN", "loadtest")
+os.environ["METRICS_PORT"] = "0"
+
+from rubpy.bot import BotClient
+from rubpy.bot.enums import ForwardedFromEnum, UpdateTypeEnum
+from rubpy.bot.models import ForwardedFrom, Message, Update
+
+import main
+import metrics
+import outbound
+import workers
+from database import init_db, models
+from database.session import write_session
+from database.writer import writer
+from database import rollup
+from database.writebehind import user_buffer
+
+DEFAULT_MIX = "chatter=55,bot=5,link=10,username=5,forward=5,command=15,start=5"
+COMMANDS = ("وضعیت", "شناسه من", "راهنما", "قفل لینک", "باز کردن لینک", "جوک", "چالش")
+CHATTER = ("سلام", "خوبین؟", "کسی هست", "امروز چه خبر", "😂😂", "موافقم", "فردا میام")
+
+
+class FakeBotClient(BotClient):
+    def __init__(self, latency: float, jitter: float):
+        super().__init__("loadtest", rate_limit=0)
+        self.latency = latency
+        self.jitter = jitter
+        self.calls: Counter[str] = Counter()
+        self._ids = 0
+
+    async def _make_request(self, method: str, data: dict, **kwargs) -> dict:
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        self._ids += 1
+        if method == "getChat":
+            chat_id = data["chat_id"]
+            return {"chat": {"chat_id": chat_id, "title": f"group {chat_id}", "first_name": "user", "username": chat_id[2:]}}
+        if method == "getMe":
+            return {"bot": {"bot_id": "b0loadtest", "username": "loadtest_bot"}}
+        return {"message_id": str(self._ids)}
+
+
+def parse_mix(text: str) -> tuple[list[str], list[int]]:
+    kinds, weights = [], []
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        kinds.append(kind.strip())
+        weights.append(int(weight))
+    return kinds, weights
+
+
+def make_update(client: BotClient, kind: str, index: int, groups: int, users: int) -> Update:
+    user = random.randrange(users)
+    chat_id = f"g0group{random.randrange(groups)}"
+    message = Message(message_id=str(index), sender_id=f"u0user{user}", time=str(index))
+    if kind == "chatter":
+        message.text = random.choice(CHATTER)
+    elif kind == "bot":
+        message.text = "ربات کجایی"
+    elif kind == "link":
+        message.text = f"ببینید https://example.com/{index}"
+    elif kind == "username":
+        message.text = f"@channel{index % 50} رو ببینید"
+    elif kind == "forward":
+        message.text = "forwarded"
+        message.forwarded_from = ForwardedFrom(type_from=ForwardedFromEnum.USER)
+    elif kind == "command":
+        message.text = random.choice(COMMANDS)
+    elif kind == "flood":
+        # A handful of senders hammering the flood-locked groups.
+        chat_id = f"g0group{index % 4 * 5 % groups}"
+        message.sender_id = f"u0user{(users // 2 + index % 4) % users}"
+        message.text = CHATTER[index % len(CHATTER)]
+    elif kind == "start":
+        chat_id = f"b0user{user}"
+        message.text = "/start"
+    else:
+        raise SystemExit(f"unknown update kind: {kind}")
+    return Update(type=UpdateTypeEnum.NewMessage, chat_id=chat_id, new_message=message, client=client)
+
+
+async def seed(groups: int, users: int) -> None:
+    await init_db()
+    async with write_session() as session:
+        session.add_all(
+            models.User(chat_id=f"b0user{i}", user_id=f"u0user{i}", username=f"user{i}") for i in range(users)
+        )
+        await session.flush()
+        for i in range(groups):
+            session.add(models.Group(
+                chat_id=f"g0group{i}",
+                title=f"group {i}",
+                owner_id=f"b0user{i % users}",
+                link_lock=i % 2 == 0,
+                username_lock=i % 3 == 0,
+                forward_lock=i % 4 == 0,
+                flood_lock=i % 5 == 0,
+            ))
+            session.add(models.GroupRole(group_id=f"g0group{i}", user_id=f"u0user{(i + 1) % users}", role="admin"))
+        await session.commit()
+
+
+def timed(handler, latencies: list[float]):
+    @functools.wraps(handler)
+    async def wrapper(client, update):
+        try:
+            return await handler(client, update)
+        finally:
+            latencies.append(time.perf_counter() - update.external_data["received"])
+    return wrapper
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    await seed(args.groups, args.users)
+
+    client = FakeBotClient(latency=args.latency / 1000, jitter=args.jitter)
+    client.middlewares = main.app.middlewares
+    latencies: list[float] = []
+    client.handlers = {
+        key: [(handler_filters, timed(handler, latencies)) for handler_filters, handler in handler_list]
+        for key, handler_list in main.app.handlers.items()
+    }
+    metrics.registry.instrument_client(client)
+    writer.start()
+    user_buffer.start()
+    rollup.stats.start()
+    outbound.dispatcher.bucket = outbound.TokenBucket(args.api_rate, capacity=args.api_rate / 10)
+    outbound.dispatcher.chats = outbound.ChatLimiter(args.chat_rate, burst=5)
+    outbound.dispatcher.start()
+    workers.dispatcher.start(client)
+
+    kinds, weights = parse_mix(args.mix)
+    updates = [
+        make_update(client, kind, index, args.groups, args.users)
+        for index, kind in enumerate(random.choices(kinds, weights, k=args.updates))
+    ]
+    sql_before = metrics.registry.sql_total
+
+    started = time.perf_counter()
+    for offset in range(0, len(updates), args.batch):
+        if args.rate:
+            await asyncio.sleep(max(0.0, started + offset / args.rate - time.perf_counter()))
+        batch = updates[offset:offset + args.batch]
+        for update in batch:
+            update.external_data["received"] = time.perf_counter()
+        # Same shape as the client's poller: one gather per fetched batch.
+        await asyncio.gather(*(client.process_update(update) for update in batch))
+    for queue in workers.dispatcher.queues:
+        await queue.join()
+    handled = time.perf_counter() - started
+    await outbound.dispatcher.join()
+    await user_buffer.flush()
+    await rollup.stats.flush()
+    elapsed = time.perf_counter() - started
+
+    total = len(updates)
+    queries = metrics.registry.sql_total - sql_before
+    print(f"updates      {total} ({args.mix})")
+    print(f"handled      {len(latencies)}  dropped {workers.dispatcher.dropped}")
+    print(f"elapsed      {elapsed:.2f}s (handlers done after {handled:.2f}s)")
+    print(f"throughput   {total / elapsed:.0f} updates/s")
+    print(f"latency      p50 {percentile(latencies, 0.5) * 1000:.1f}ms  p99 {percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"queries      {queries / total:.2f} per update ({queries} total)")
+    print(f"api calls    {sum(client.calls.values()) / total:.2f} per update {dict(client.calls.most_common())}")
+    print()
+    print(f"{'outbound':<12}{'sent':>8}{'dropped':>9}{'merged':>8}{'retried':>9}{'mean queue ms':>15}")
+    for priority, name in enumerate(outbound.PRIORITIES):
+        latency = outbound.dispatcher.latency[priority]
+        mean = latency.total / latency.count * 1000 if latency.count else 0.0
+        print(
+            f"{name:<12}{outbound.dispatcher.sent[priority]:>8}{outbound.dispatcher.dropped[priority]:>9}"
+            f"{outbound.dispatcher.coalesced[priority]:>8}{outbound.dispatcher.retried[priority]:>9}{mean:>15.1f}"
+        )
+    print()
+    print(f"{'handler':<24}{'calls':>8}{'mean ms':>10}{'sql/call':>10}{'api/call':>10}")
+    for name, stats in sorted(metrics.registry.handlers.items(), key=lambda item: -item[1].latency.count):
+        count = stats.latency.count or 1
+        print(f"{name:<24}{stats.latency.count:>8}{stats.latency.total / count * 1000:>10.1f}{stats.sql / count:>10.2f}{stats.api / count:>10.2f}")
+
+    await workers.dispatcher.stop()
+    await outbound.dispatcher.stop()
+    await user_buffer.stop()
+    await rollup.stats.stop()
+    await writer.stop()
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="kind=weight list; kinds: chatter, bot, link, username, forward, flood, command, start")
+    parser.add_argument("--latency", type=float, default=20, help="simulated API latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency jitter as a fraction of --latency")
+    parser.add_argument("--batch", type=int, default=100, help="updates per simulated poll")
+    parser.add_argument("--rate", type=float, default=0, help="offered load in updates/s (0 = as fast as possible)")
+    parser.add_argument("--api-rate", type=float, default=0, help="global send budget in calls/s (0 = unlimited)")
+    parser.add_argument("--chat-rate", type=float, default=0, help="per-chat message budget in messages/s (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,106 @@
+"""Throughput of the multi-process mode against the worker-process count.
+
+Forks the real workers (supervisor.spawn) over a throwaway SQLite database,
+routes raw updates to them by consistent hashing the way the supervisor's
+receiver does, and times until every worker has drained and exited. API
+calls are answered by the load test's FakeBotClient. Run from the
+repository root, on a machine with at least as many cores as processes:
+
+    python bench/processes.py --processes 1,2,4 --updates 20000 --groups 200 --users 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+# Unlimited send budgets, as in the load test's defaults, so the handlers are what is measured.
+os.environ.setdefault("OUTBOUND_CHAT_RATE", "0")
+
+import loadtest  # sets up the throwaway database and imports the bot
+
+import main
+import supervisor
+
+
+async def offline() -> None:
+    # No network: without a session the joke command falls back like it does in the load test.
+    return None
+
+
+def raw_update(kind: str, index: int, groups: int, users: int) -> dict:
+    # The item getUpdates returns for the same update the load test builds.
+    update = loadtest.make_update(None, kind, index, groups, users)
+    message = update.new_message
+    return {
+        "type": "NewMessage",
+        "chat_id": update.chat_id,
+        "new_message": {
+            "message_id": message.message_id,
+            "text": message.text,
+            "sender_id": message.sender_id,
+            "time": message.time,
+        },
+    }
+
+
+async def feed(sockets: list, updates: list[dict]) -> tuple[float, list[int]]:
+    links = [await supervisor.Link.open(sock) for sock in sockets]
+    ring = supervisor.HashRing(len(links))
+    ready = 0
+    while ready < len(links):
+        ready = sum([await link.receive() == ["ready", index] for index, link in enumerate(links)])
+    shares = [0] * len(links)
+    started = time.perf_counter()
+    for item in updates:
+        node = ring.node_for(item["chat_id"])
+        shares[node] += 1
+        links[node].send(["update", item])
+        await links[node].drain()
+    for link in links:
+        link.finish()
+    # A worker closes its end once it has handled everything and shut down.
+    for link in links:
+        while await link.receive() is not None:
+            pass
+        link.close()
+    return time.perf_counter() - started, shares
+
+
+def run(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    asyncio.run(loadtest.seed(args.groups, args.users))
+    asyncio.run(supervisor.migrate())
+    main.app._make_request = loadtest.FakeBotClient(args.latency / 1000, args.jitter)._make_request
+    main.joke.feed.start = offline
+    weights = [int(part.partition("=")[2]) for part in args.mix.split(",")]
+    kinds = [part.partition("=")[0] for part in args.mix.split(",")]
+    updates = [
+        raw_update(kind, index, args.groups, args.users)
+        for index, kind in enumerate(random.choices(kinds, weights, k=args.updates))
+    ]
+    print(f"{'processes':>9}{'seconds':>10}{'updates/s':>11}{'speedup':>9}  updates per worker")
+    baseline = None
+    for processes in map(int, args.processes.split(",")):
+        sockets, children = supervisor.spawn(main.app, processes)
+        elapsed, shares = asyncio.run(feed(sockets, updates))
+        supervisor.reap(children)
+        throughput = len(updates) / elapsed
+        baseline = baseline or throughput
+        print(f"{processes:>9}{elapsed:>10.2f}{throughput:>11.0f}{throughput / baseline:>8.2f}x  {shares}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", default="1,2,4")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--mix", default="chatter=60,bot=5,link=10,username=5,command=15,start=5")
+    parser.add_argument("--latency", type=float, default=20, help="simulated API latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
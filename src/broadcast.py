@@ -0,0 +1,191 @@
+import asyncio
+import contextlib
+import os
+from collections import Counter
+from typing import AsyncIterable, Awaitable, Callable, Iterable
+
+from rubpy.bot import BotClient
+
+import outbound
+import responses
+from database import async_session, crud, models
+from database.writer import writer
+from outbound import classify_failure
+
+PENDING = 0
+SENT = 1
+FAILED = 2
+
+
+class Progress:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.failures: Counter[str] = Counter()
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+
+class Broadcast:
+    def __init__(
+        self,
+        client: BotClient,
+        text: str,
+        *,
+        concurrency: int | None = None,
+        retries: int | None = None,
+        backoff: float | None = None,
+        progress_interval: float | None = None,
+        on_progress: Callable[[Progress], Awaitable[None]] | None = None,
+        on_result: Callable[[str, str | None], None] | None = None,
+        progress: Progress | None = None,
+    ):
+        self.client = client
+        self.text = text
+        self.reply = responses.Reply(text)
+        self.concurrency = max(1, concurrency or int(os.getenv("BROADCAST_CONCURRENCY", "8")))
+        self.retries = retries if retries is not None else int(os.getenv("BROADCAST_RETRIES", "2"))
+        self.backoff = backoff if backoff is not None else float(os.getenv("BROADCAST_BACKOFF", "1"))
+        self.progress_interval = progress_interval or float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+        self.on_progress = on_progress
+        self.on_result = on_result
+        self.progress = progress or Progress()
+        self._reporter: asyncio.Task | None = None
+
+    async def send(self, chat_id: str) -> str | None:
+        # Rate limiting and retries happen in the outbound dispatcher, below deletes and command replies.
+        try:
+            await outbound.dispatcher.submit(
+                self.client,
+                outbound.BROADCAST,
+                chat_id,
+                "sendMessage",
+                self.reply.build(chat_id),
+                wait=True,
+                retries=self.retries,
+                backoff=self.backoff,
+            )
+            return None
+        except Exception as exc:
+            kind, _ = classify_failure(exc)
+            print(f"Broadcast failed for {chat_id} ({kind}): {exc}")
+            return kind
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            chat_id = await queue.get()
+            try:
+                if chat_id is None:
+                    return
+                failure = await self.send(chat_id)
+                if failure is None:
+                    self.progress.sent += 1
+                else:
+                    self.progress.failed += 1
+                    self.progress.failures[failure] += 1
+                if self.on_result:
+                    self.on_result(chat_id, failure)
+            finally:
+                queue.task_done()
+
+    async def _report(self) -> None:
+        reported = -1
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            if self.progress.done == reported:
+                continue
+            reported = self.progress.done
+            try:
+                await self.on_progress(self.progress)
+            except Exception as exc:
+                print(f"Failed to report broadcast progress: {exc}")
+
+    @contextlib.asynccontextmanager
+    async def reporting(self):
+        """Reports progress every progress_interval for as long as the block runs, across any number of run() calls."""
+        if self._reporter is not None or not self.on_progress:
+            yield
+            return
+        self._reporter = asyncio.create_task(self._report())
+        try:
+            yield
+        finally:
+            self._reporter.cancel()
+            await asyncio.gather(self._reporter, return_exceptions=True)
+            self._reporter = None
+
+    async def run(self, chat_ids: Iterable[str] | AsyncIterable[str]) -> Progress:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            async with self.reporting():
+                if isinstance(chat_ids, AsyncIterable):
+                    async for chat_id in chat_ids:
+                        await queue.put(chat_id)
+                else:
+                    for chat_id in chat_ids:
+                        await queue.put(chat_id)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return self.progress
+
+
+async def run_job(
+    client: BotClient,
+    job: models.BroadcastJob,
+    on_progress: Callable[[Progress], Awaitable[None]] | None = None,
+) -> Progress:
+    batch_size = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+    progress = Progress()
+    progress.sent = job.sent
+    progress.failed = job.failed
+    cursor = job.cursor
+    statuses = bytearray(job.batch or b"")
+
+    async def checkpoint(status: str = "running") -> None:
+        await writer.run(
+            crud.checkpoint_broadcast_job,
+            job.id,
+            cursor=cursor,
+            batch=bytes(statuses) if statuses else None,
+            sent=progress.sent,
+            failed=progress.failed,
+            status=status,
+        )
+
+    async def report(progress: Progress) -> None:
+        await checkpoint()
+        if on_progress:
+            await on_progress(progress)
+
+    index: dict[str, int] = {}
+
+    def on_result(chat_id: str, failure: str | None) -> None:
+        statuses[index[chat_id]] = SENT if failure is None else FAILED
+
+    # One sender for the whole job, so progress keeps being reported however short each batch is.
+    sender = Broadcast(client, job.text, on_progress=report, on_result=on_result, progress=progress)
+    async with sender.reporting():
+        while True:
+            async with async_session() as session:
+                # A partially sent batch is reloaded at its stored length so statuses stay aligned.
+                targets = await crud.stream_broadcast_targets(session, job.id, cursor, len(statuses) or batch_size)
+            if not targets:
+                break
+            if len(statuses) != len(targets):
+                statuses = bytearray(len(targets))
+            index = {chat_id: position for position, chat_id in enumerate(targets)}
+            await sender.run([chat_id for chat_id, status in zip(targets, statuses) if status == PENDING])
+            cursor = targets[-1]
+            statuses = bytearray()
+            await checkpoint()
+
+    await checkpoint("done")
+    return progress
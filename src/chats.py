@@ -0,0 +1,63 @@
+import asyncio
+import os
+import time
+
+from rubpy.bot import BotClient
+from rubpy.bot.models import Chat
+
+from database.cache import MISSING, TTLCache
+
+
+class ChatCache:
+    def __init__(self, maxsize: int, ttl: float, refresh_after: float):
+        self.refresh_after = refresh_after
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def get(self, client: BotClient, chat_id: str) -> Chat:
+        entry = self._entries.get(chat_id)
+        if entry is MISSING:
+            return await asyncio.shield(self._load(client, chat_id))
+        fetched_at, chat = entry
+        # Serve the cached chat right away and refresh it in the background once it is old.
+        if time.monotonic() - fetched_at > self.refresh_after:
+            self._load(client, chat_id)
+        return chat
+
+    def prime(self, chat_id: str, chat: Chat) -> None:
+        self._entries.set(chat_id, (time.monotonic(), chat))
+
+    def invalidate(self, chat_id: str) -> None:
+        self._entries.invalidate(chat_id)
+
+    def stats(self) -> dict[str, int]:
+        return {**self._entries.stats(), "inflight": len(self._inflight)}
+
+    def _load(self, client: BotClient, chat_id: str) -> asyncio.Task:
+        task = self._inflight.get(chat_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(client, chat_id))
+            self._inflight[chat_id] = task
+            task.add_done_callback(lambda done: self._finish(chat_id, done))
+        return task
+
+    def _finish(self, chat_id: str, task: asyncio.Task) -> None:
+        self._inflight.pop(chat_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"get_chat failed for {chat_id}: {task.exception()}")
+
+    async def _fetch(self, client: BotClient, chat_id: str) -> Chat:
+        chat = await client.get_chat(chat_id)
+        self.prime(chat_id, chat)
+        return chat
+
+
+cache = ChatCache(
+    maxsize=int(os.getenv("CHAT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("CHAT_CACHE_TTL", "3600")),
+    refresh_after=float(os.getenv("CHAT_CACHE_REFRESH", "300")),
+)
+
+
+async def get_chat(client: BotClient, chat_id: str) -> Chat:
+    return await cache.get(client, chat_id)
@@ -2,7 +2,8 @@
 from .config import engine
 from .session import async_session
 from .models import Base
+from . import migrations
 
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await migrations.upgrade(conn)
\ No newline at end of file
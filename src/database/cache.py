@@ -0,0 +1,135 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, NamedTuple
+
+MISSING = object()
+
+# Every named cache, so invalidations arriving from other processes can find theirs.
+stores: dict[str, "TTLCache"] = {}
+
+# Set in supervisor mode: sends ("invalidate", name, key) or ("clear", name) to the other worker processes.
+peers: Callable[[list], None] | None = None
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, name: str | None = None):
+        self.name = name
+        if name is not None:
+            stores[name] = self
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        # A load that started before an invalidation must not repopulate the entry.
+        if generation is not None and generation != self.generation:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def invalidate(store: TTLCache, key: Hashable) -> None:
+    store.invalidate(key)
+    if peers is not None and store.name is not None:
+        peers(["invalidate", store.name, key])
+
+
+def clear(store: TTLCache) -> None:
+    store.clear()
+    if peers is not None and store.name is not None:
+        peers(["clear", store.name])
+
+
+class GroupSettings(NamedTuple):
+    chat_id: str
+    owner_id: str | None
+    link_lock: bool
+    username_lock: bool
+    forward_lock: bool
+    flood_lock: bool
+    language: str | None
+
+
+class PrivilegedMembers(NamedTuple):
+    owners: frozenset[str]
+    admins: frozenset[str]
+
+    def is_owner(self, user_id: str) -> bool:
+        return user_id in self.owners
+
+    def is_privileged(self, user_id: str) -> bool:
+        return user_id in self.owners or user_id in self.admins
+
+
+class GroupPage(NamedTuple):
+    # (chat_id, title, rank) rows; rank 0 is the main owner, 1 an owner, 2 an admin.
+    groups: tuple[tuple[str, str | None, int], ...]
+    before: str | None
+    after: str | None
+
+
+group_settings = TTLCache(
+    maxsize=int(os.getenv("GROUP_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("GROUP_CACHE_TTL", "300")),
+    name="group_settings",
+)
+
+privileged_members = TTLCache(
+    maxsize=int(os.getenv("GROUP_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("GROUP_CACHE_TTL", "300")),
+    name="privileged_members",
+)
+
+# Rendered "وضعیت" replies; dropped with any lock, language or role change of the group.
+group_status = TTLCache(
+    maxsize=int(os.getenv("GROUP_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("GROUP_CACHE_TTL", "300")),
+    name="group_status",
+)
+
+user_languages = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "3600")),
+    name="user_languages",
+)
+
+# The "my groups" pages of each user, as {(direction, cursor): GroupPage}; dropped when the user's roles change.
+user_groups = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("GROUP_CACHE_TTL", "300")),
+    name="user_groups",
+)
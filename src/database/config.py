@@ -1,4 +1,6 @@
 # src/database/config.py
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine
 import os
 from dotenv import load_dotenv
@@ -6,9 +8,86 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+BACKEND = make_url(DATABASE_URL).get_backend_name()
+# One writer task owns all mutations; only meaningful for a file-backed SQLite database.
+SINGLE_WRITER = (
+    BACKEND == "sqlite"
+    and os.getenv("DB_SINGLE_WRITER", "0") == "1"
+    and make_url(DATABASE_URL).database not in (None, "", ":memory:")
+)
+
+# Applied on every new SQLite connection; an empty value keeps SQLite's default.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT", "5000"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", "268435456"),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),
+}
+
+
+def _engine_options() -> dict:
+    if BACKEND == "sqlite":
+        # Local file: nothing to ping, and a dropped connection can't happen.
+        return {"pool_pre_ping": False}
+    if BACKEND == "postgresql":
+        options = {
+            "pool_pre_ping": True,
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        }
+        # Only asyncpg takes this argument; other drivers reject it on connect.
+        if make_url(DATABASE_URL).get_driver_name() == "asyncpg":
+            options["connect_args"] = {"prepared_statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))}
+        return options
+    return {"pool_pre_ping": True}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        if value:
+            cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+def _query_only(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def _manual_transactions(dbapi_connection, connection_record) -> None:
+    # Hand transaction control to SQLAlchemy so the writer can open every batch with BEGIN IMMEDIATE.
+    dbapi_connection.isolation_level = None
+
+
+def _begin_immediate(conn) -> None:
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,
-    pool_pre_ping=True,
     future=True,
-)
\ No newline at end of file
+    **_engine_options(),
+)
+
+if BACKEND == "sqlite":
+    event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
+if SINGLE_WRITER:
+    event.listen(engine.sync_engine, "connect", _manual_transactions)
+    event.listen(engine.sync_engine, "begin", _begin_immediate)
+    read_engine = create_async_engine(
+        DATABASE_URL,
+        echo=False,
+        future=True,
+        **_engine_options(),
+    )
+    event.listen(read_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    event.listen(read_engine.sync_engine, "connect", _query_only)
+else:
+    read_engine = engine
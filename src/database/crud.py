@@ -1,8 +1,18 @@
 # src/database/crud.py
 from typing import Literal
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from . import models
+from . import cache, models
+
+def _invalidate(session: AsyncSession, store: cache.TTLCache, key: str) -> None:
+    # Drop now and again once the transaction ends, so readers that raced the commit cannot keep a stale entry.
+    # Other processes only hear of it after the commit, once a reload there would see the new rows.
+    store.invalidate(key)
+    session.info.setdefault("after_commit", []).append(lambda: cache.invalidate(store, key))
+
+def _invalidate_all(session: AsyncSession, store: cache.TTLCache) -> None:
+    store.clear()
+    session.info.setdefault("after_commit", []).append(lambda: cache.clear(store))
 
 async def upsert_user(session: AsyncSession, chat_id: str, user_id: str, username: str | None) -> models.User:
     result = await session.execute(select(models.User).where(models.User.chat_id == chat_id))
@@ -15,9 +25,16 @@ async def upsert_user(session: AsyncSession, chat_id: str, user_id: str, usernam
     return user
 
 async def upsert_group(session: AsyncSession, group_id: int, title: str | None, owner: models.User) -> models.Group:
+    _invalidate(session, cache.group_settings, group_id)
+    _invalidate(session, cache.privileged_members, group_id)
+    _invalidate(session, cache.group_status, group_id)
     result = await session.execute(select(models.Group).where(models.Group.chat_id == group_id))
     group = result.scalar_one_or_none()
+    _invalidate(session, cache.user_groups, owner.user_id)
     if group:
+        if (title and title != group.title) or group.owner_id != owner.chat_id:
+            # A new title or main owner shows in the lists of every member; reinstalls are rare enough to drop them all.
+            _invalidate_all(session, cache.user_groups)
         group.title = title or group.title
         group.owner = owner
         return group, "Exist"
@@ -30,6 +47,14 @@ async def log_install(session: AsyncSession, group: models.Group, owner: models.
     session.add(event)
     return event
 
+async def install_group(session: AsyncSession, group_id: str, title: str | None, owner_chat_id: str) -> str:
+    owner = await session.get(models.User, owner_chat_id)
+    group, status = await upsert_group(session, group_id=group_id, title=title, owner=owner)
+    await ensure_group_role(session, group.chat_id, owner.user_id, "owner")
+    if status != "Exist":
+        await log_install(session, group, owner)
+    return status
+
 async def update_group_locks(
     session: AsyncSession,
     group_id: str,
@@ -37,7 +62,10 @@ async def update_group_locks(
     link_lock: bool | None = None,
     username_lock: bool | None = None,
     forward_lock: bool | None = None,
+    flood_lock: bool | None = None,
 ) -> models.Group | None:
+    _invalidate(session, cache.group_settings, group_id)
+    _invalidate(session, cache.group_status, group_id)
     result = await session.execute(select(models.Group).where(models.Group.chat_id == group_id))
     group = result.scalar_one_or_none()
     if group is None:
@@ -48,8 +76,25 @@ async def update_group_locks(
         group.username_lock = username_lock
     if forward_lock is not None:
         group.forward_lock = forward_lock
+    if flood_lock is not None:
+        group.flood_lock = flood_lock
     return group
 
+async def set_group_language(session: AsyncSession, group_id: str, language: str) -> bool:
+    _invalidate(session, cache.group_settings, group_id)
+    _invalidate(session, cache.group_status, group_id)
+    result = await session.execute(
+        update(models.Group).where(models.Group.chat_id == group_id).values(language=language)
+    )
+    return result.rowcount > 0
+
+async def set_user_language(session: AsyncSession, chat_id: str, language: str) -> bool:
+    _invalidate(session, cache.user_languages, chat_id)
+    result = await session.execute(
+        update(models.User).where(models.User.chat_id == chat_id).values(language=language)
+    )
+    return result.rowcount > 0
+
 async def ensure_group_role(
     session: AsyncSession,
     group_id: str,
@@ -68,23 +113,11 @@ async def ensure_group_role(
         return group_role
     group_role = models.GroupRole(group_id=group_id, user_id=user_id, role=role)
     session.add(group_role)
+    _invalidate(session, cache.privileged_members, group_id)
+    _invalidate(session, cache.group_status, group_id)
+    _invalidate(session, cache.user_groups, user_id)
     return group_role
 
-async def user_has_role(
-    session: AsyncSession,
-    group_id: str,
-    user_id: str,
-    role: Literal["owner", "admin"],
-) -> bool:
-    result = await session.execute(
-        select(models.GroupRole.id).where(
-            models.GroupRole.group_id == group_id,
-            models.GroupRole.user_id == user_id,
-            models.GroupRole.role == role,
-        )
-    )
-    return result.scalar_one_or_none() is not None
-
 async def remove_group_role(
     session: AsyncSession,
     group_id: str,
@@ -102,4 +135,60 @@ async def remove_group_role(
     if group_role is None:
         return False
     await session.delete(group_role)
-    return True
\ No newline at end of file
+    _invalidate(session, cache.privileged_members, group_id)
+    _invalidate(session, cache.group_status, group_id)
+    _invalidate(session, cache.user_groups, user_id)
+    return True
+
+async def create_broadcast_job(
+    session: AsyncSession,
+    requester_id: str,
+    text: str,
+    progress_message_id: str | None,
+) -> models.BroadcastJob:
+    job = models.BroadcastJob(requester_id=requester_id, text=text, progress_message_id=progress_message_id)
+    session.add(job)
+    await session.flush()
+    return job
+
+async def get_running_broadcast_jobs(session: AsyncSession) -> list[models.BroadcastJob]:
+    result = await session.execute(
+        select(models.BroadcastJob).where(models.BroadcastJob.status == "running").order_by(models.BroadcastJob.id)
+    )
+    return list(result.scalars())
+
+async def stream_broadcast_targets(session: AsyncSession, job_id: int, after: str | None, limit: int) -> list[str]:
+    # Groups installed after the job was created are skipped, so a resumed batch lines up with its stored statuses.
+    stmt = (
+        select(models.Group.chat_id)
+        .where(
+            models.Group.created_at
+            <= select(models.BroadcastJob.created_at).where(models.BroadcastJob.id == job_id).scalar_subquery()
+        )
+        .order_by(models.Group.chat_id)
+        .limit(limit)
+        .execution_options(yield_per=limit)
+    )
+    if after is not None:
+        stmt = stmt.where(models.Group.chat_id > after)
+    result = await session.stream_scalars(stmt)
+    return [chat_id async for chat_id in result]
+
+async def checkpoint_broadcast_job(
+    session: AsyncSession,
+    job_id: int,
+    *,
+    cursor: str | None,
+    batch: bytes | None,
+    sent: int,
+    failed: int,
+    status: str = "running",
+) -> None:
+    await session.execute(
+        update(models.BroadcastJob)
+        .where(models.BroadcastJob.id == job_id)
+        .values(cursor=cursor, batch=batch, sent=sent, failed=failed, status=status)
+    )
+
+async def set_broadcast_job_status(session: AsyncSession, job_id: int, status: str) -> None:
+    await session.execute(update(models.BroadcastJob).where(models.BroadcastJob.id == job_id).values(status=status))
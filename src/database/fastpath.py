@@ -0,0 +1,172 @@
+from sqlalchemy import bindparam, case, func, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import cache, models
+from .writebehind import user_buffer
+
+# Core tables and module-level statements: the statements are built once, so their
+# cache keys are memoized and every call is a straight compiled-cache hit. Rows come
+# back as plain tuples or slotted records, never as ORM instances.
+users = models.User.__table__
+groups = models.Group.__table__
+roles = models.GroupRole.__table__
+
+
+class UserRecord:
+    __slots__ = ("chat_id", "user_id", "username")
+
+    def __init__(self, chat_id: str, user_id: str, username: str | None):
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.username = username
+
+
+GROUP_SETTINGS = select(
+    groups.c.chat_id,
+    groups.c.owner_id,
+    groups.c.link_lock,
+    groups.c.username_lock,
+    groups.c.forward_lock,
+    groups.c.flood_lock,
+    groups.c.language,
+).where(groups.c.chat_id == bindparam("group_id"))
+
+PRIVILEGED_MEMBERS = (
+    select(users.c.user_id, literal("owner"))
+    .select_from(users.join(groups, groups.c.owner_id == users.c.chat_id))
+    .where(groups.c.chat_id == bindparam("group_id"))
+    .union_all(
+        select(roles.c.user_id, roles.c.role).where(roles.c.group_id == bindparam("group_id"))
+    )
+)
+
+USER_BY_USER_ID = select(users.c.chat_id, users.c.user_id, users.c.username).where(
+    users.c.user_id == bindparam("user_id")
+)
+
+USER_LANGUAGE = select(users.c.language).where(users.c.chat_id == bindparam("chat_id"))
+
+# The main owner and every role holder with their user rows, in one round trip.
+STATUS_MEMBERS = (
+    select(literal("main"), users.c.chat_id, users.c.user_id, users.c.username)
+    .select_from(groups.join(users, groups.c.owner_id == users.c.chat_id))
+    .where(groups.c.chat_id == bindparam("group_id"))
+    .union_all(
+        select(roles.c.role, users.c.chat_id, roles.c.user_id, users.c.username)
+        .select_from(roles.outerjoin(users, users.c.user_id == roles.c.user_id))
+        .where(roles.c.group_id == bindparam("group_id"))
+    )
+)
+
+# Every group a user owns or holds a role in, each once with its highest rank. Both
+# branches are index lookups (users.user_id, groups.owner_id, group_roles.user_id).
+_memberships = union_all(
+    select(groups.c.chat_id, groups.c.title, literal(0).label("rank"))
+    .select_from(users.join(groups, groups.c.owner_id == users.c.chat_id))
+    .where(users.c.user_id == bindparam("user_id")),
+    select(groups.c.chat_id, groups.c.title, case((roles.c.role == "owner", 1), else_=2))
+    .select_from(roles.join(groups, groups.c.chat_id == roles.c.group_id))
+    .where(roles.c.user_id == bindparam("user_id")),
+).subquery()
+
+_user_groups = select(
+    _memberships.c.chat_id, func.max(_memberships.c.title), func.min(_memberships.c.rank)
+).group_by(_memberships.c.chat_id).limit(bindparam("limit"))
+
+# Keyset pages: the rows after (or, walking back, before) the cursor, one extra to tell whether more remain.
+USER_GROUPS_AFTER = _user_groups.where(_memberships.c.chat_id > bindparam("cursor")).order_by(_memberships.c.chat_id)
+USER_GROUPS_BEFORE = _user_groups.where(_memberships.c.chat_id < bindparam("cursor")).order_by(
+    _memberships.c.chat_id.desc()
+)
+
+
+async def get_group_settings(session: AsyncSession, group_id: str) -> cache.GroupSettings | None:
+    settings = cache.group_settings.get(group_id)
+    if settings is not cache.MISSING:
+        return settings
+    generation = cache.group_settings.generation
+    conn = await session.connection()
+    row = (await conn.execute(GROUP_SETTINGS, {"group_id": group_id})).first()
+    settings = cache.GroupSettings(*row) if row else None
+    cache.group_settings.set(group_id, settings, generation)
+    return settings
+
+
+async def get_privileged_members(session: AsyncSession, group_id: str) -> cache.PrivilegedMembers:
+    members = cache.privileged_members.get(group_id)
+    if members is not cache.MISSING:
+        return members
+    generation = cache.privileged_members.generation
+    conn = await session.connection()
+    owners, admins = set(), set()
+    for user_id, role in await conn.execute(PRIVILEGED_MEMBERS, {"group_id": group_id}):
+        if role == "owner":
+            owners.add(user_id)
+        elif role == "admin":
+            admins.add(user_id)
+    members = cache.PrivilegedMembers(frozenset(owners), frozenset(admins))
+    cache.privileged_members.set(group_id, members, generation)
+    return members
+
+
+async def get_user(session: AsyncSession, user_id: str) -> UserRecord | None:
+    await user_buffer.ensure_flushed(user_id)
+    conn = await session.connection()
+    row = (await conn.execute(USER_BY_USER_ID, {"user_id": user_id})).first()
+    return UserRecord(*row) if row else None
+
+
+async def get_status_members(
+    session: AsyncSession, group_id: str
+) -> tuple[UserRecord | None, list[UserRecord], list[UserRecord]]:
+    conn = await session.connection()
+    main_owner = None
+    owners: dict[str, UserRecord] = {}
+    admins: dict[str, UserRecord] = {}
+    for role, chat_id, user_id, username in await conn.execute(STATUS_MEMBERS, {"group_id": group_id}):
+        record = UserRecord(chat_id, user_id, username)
+        if role == "main":
+            main_owner = record
+        elif role == "owner":
+            owners.setdefault(user_id, record)
+        elif role == "admin":
+            admins.setdefault(user_id, record)
+    if main_owner is not None:
+        owners.pop(main_owner.user_id, None)
+    return main_owner, list(owners.values()), list(admins.values())
+
+
+async def get_user_language(session: AsyncSession, chat_id: str) -> str | None:
+    language = cache.user_languages.get(chat_id)
+    if language is not cache.MISSING:
+        return language
+    generation = cache.user_languages.generation
+    conn = await session.connection()
+    language = (await conn.execute(USER_LANGUAGE, {"chat_id": chat_id})).scalar()
+    cache.user_languages.set(chat_id, language, generation)
+    return language
+
+
+async def get_user_groups(session: AsyncSession, user_id: str, direction: str, cursor: str, size: int) -> cache.GroupPage:
+    pages = cache.user_groups.get(user_id)
+    if pages is not cache.MISSING and (direction, cursor) in pages:
+        return pages[(direction, cursor)]
+    generation = cache.user_groups.generation
+    conn = await session.connection()
+    backwards = direction == "prev"
+    statement = USER_GROUPS_BEFORE if backwards else USER_GROUPS_AFTER
+    rows = [tuple(row) for row in await conn.execute(statement, {"user_id": user_id, "cursor": cursor, "limit": size + 1})]
+    more = len(rows) > size
+    rows = rows[:size]
+    if backwards:
+        rows.reverse()
+        before, after = (rows[0][0] if more else None), (rows[-1][0] if rows else None)
+    else:
+        before, after = (rows[0][0] if cursor and rows else None), (rows[-1][0] if more else None)
+    page = cache.GroupPage(tuple(rows), before, after)
+    if pages is cache.MISSING:
+        pages = {}
+        cache.user_groups.set(user_id, pages, generation)
+    # An invalidation during the query dropped the dict (or set refused it), so this page goes nowhere.
+    if generation == cache.user_groups.generation:
+        pages[(direction, cursor)] = page
+    return page
@@ -0,0 +1,97 @@
+from typing import Callable
+from sqlalchemy import Column, Connection, Integer, MetaData, String, Table, cast, func, inspect, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateIndex
+from .models import Base
+
+schema_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    schema_metadata,
+    Column("version", Integer, nullable=False),
+)
+
+BASELINE_TABLES = ("users", "groups", "install_events", "group_roles", "broadcast_jobs")
+
+
+def _create_baseline(conn: Connection) -> None:
+    # Deployments created by the old create_all() already have these tables; checkfirst leaves them alone.
+    tables = [Base.metadata.tables[name] for name in BASELINE_TABLES]
+    Base.metadata.create_all(conn, tables=tables, checkfirst=True)
+
+
+def _create_lookup_indexes(conn: Connection) -> None:
+    for name in ("users", "groups", "group_roles"):
+        for index in Base.metadata.tables[name].indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(info["name"] == column for info in inspect(conn).get_columns(table))
+
+
+def _add_language_columns(conn: Connection) -> None:
+    for table in ("users", "groups"):
+        if not has_column(conn, table, "language"):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN language VARCHAR(8)"))
+
+
+def _add_flood_lock_column(conn: Connection) -> None:
+    if not has_column(conn, "groups", "flood_lock"):
+        conn.execute(text("ALTER TABLE groups ADD COLUMN flood_lock BOOLEAN NOT NULL DEFAULT FALSE"))
+
+
+def _create_stat_tables(conn: Connection) -> None:
+    counters = Base.metadata.tables["stat_counters"]
+    tables = [counters, Base.metadata.tables["active_groups"]]
+    Base.metadata.create_all(conn, tables=tables, checkfirst=True)
+    if conn.execute(select(counters.c.name).limit(1)).first() is not None:
+        return
+    # Seed the install counters from the history that exists so far; from here on they are kept incrementally.
+    installs = Base.metadata.tables["install_events"]
+    day = cast(func.date(installs.c.installed_at), String(10))
+    columns = [counters.c.period, counters.c.name, counters.c.value]
+    conn.execute(
+        counters.insert().from_select(
+            columns, select(day, literal("installs"), func.count()).group_by(day)
+        )
+    )
+    conn.execute(
+        counters.insert().from_select(
+            columns, select(literal("total"), literal("installs"), func.count()).select_from(installs)
+        )
+    )
+
+
+MIGRATIONS: list[tuple[int, Callable[[Connection], None]]] = [
+    (1, _create_baseline),
+    (2, _create_lookup_indexes),
+    (3, _add_language_columns),
+    (4, _add_flood_lock_column),
+    (5, _create_stat_tables),
+]
+
+
+def current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(schema_version.name):
+        return 0
+    return conn.execute(select(schema_version.c.version)).scalar() or 0
+
+
+def _upgrade(conn: Connection) -> None:
+    schema_metadata.create_all(conn, checkfirst=True)
+    version = current_version(conn)
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        migration(conn)
+        if version == 0:
+            conn.execute(schema_version.insert().values(version=target))
+        else:
+            conn.execute(schema_version.update().values(version=target))
+        version = target
+        print(f"database migrated to version {target}")
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    await conn.run_sync(_upgrade)
@@ -2,7 +2,7 @@
 from datetime import datetime
 from tokenize import group
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, func, UniqueConstraint, String
+from sqlalchemy import BigInteger, ForeignKey, false, func, Index, UniqueConstraint, String, Text, LargeBinary
 
 class Base(DeclarativeBase):
     pass
@@ -11,8 +11,9 @@ class User(Base):
     __tablename__ = "users"
 
     chat_id: Mapped[str] = mapped_column(String(255), primary_key=True, autoincrement=False)  # chat_id روبیکا
-    user_id: Mapped[str] = mapped_column(String(255), autoincrement=False)  # user_id روبیکا
+    user_id: Mapped[str] = mapped_column(String(255), autoincrement=False, index=True)  # user_id روبیکا
     username: Mapped[str | None] = mapped_column(String(255))
+    language: Mapped[str | None] = mapped_column(String(8))
     first_seen_at: Mapped[datetime] = mapped_column(server_default=func.now())
 
     installations: Mapped[list["InstallEvent"]] = relationship(
@@ -21,17 +22,21 @@ class User(Base):
     )
     groups_owned: Mapped[list["Group"]] = relationship(back_populates="owner")
 
+    __table_args__ = (Index("ix_users_username_lower", func.lower(username)),)
+
 class Group(Base):
     __tablename__ = "groups"
 
     chat_id: Mapped[str] = mapped_column(String(255), primary_key=True, autoincrement=False)  # group_id روبیکا
     title: Mapped[str | None] = mapped_column(String(255))
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
-    owner_id: Mapped[str | None] = mapped_column(String(255), ForeignKey("users.chat_id"))
+    owner_id: Mapped[str | None] = mapped_column(String(255), ForeignKey("users.chat_id"), index=True)
 
     link_lock: Mapped[bool] = mapped_column(default=True)
     username_lock: Mapped[bool] = mapped_column(default=True)
     forward_lock: Mapped[bool] = mapped_column(default=True)
+    flood_lock: Mapped[bool] = mapped_column(default=False, server_default=false())
+    language: Mapped[str | None] = mapped_column(String(8))
 
     owner: Mapped[User | None] = relationship(back_populates="groups_owned")
     installs: Mapped[list["InstallEvent"]] = relationship(back_populates="group")
@@ -50,7 +55,10 @@ class InstallEvent(Base):
 
 class GroupRole(Base):
     __tablename__ = "group_roles"
-    __table_args__ = (UniqueConstraint("group_id", "user_id", "role"),)
+    __table_args__ = (
+        UniqueConstraint("group_id", "user_id", "role"),
+        Index("ix_group_roles_user_id", "user_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     group_id: Mapped[str] = mapped_column(String(255), ForeignKey("groups.chat_id"))
@@ -58,4 +66,31 @@ class GroupRole(Base):
     role: Mapped[str] = mapped_column(String(64))
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
 
-    group: Mapped[Group] = relationship(back_populates="roles")
\ No newline at end of file
+    group: Mapped[Group] = relationship(back_populates="roles")
+
+class BroadcastJob(Base):
+    __tablename__ = "broadcast_jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    requester_id: Mapped[str] = mapped_column(String(255))
+    text: Mapped[str] = mapped_column(Text)
+    status: Mapped[str] = mapped_column(String(16), default="running")
+    progress_message_id: Mapped[str | None] = mapped_column(String(255))
+    cursor: Mapped[str | None] = mapped_column(String(255))  # آخرین گروهِ دسته‌ی کامل‌شده
+    batch: Mapped[bytes | None] = mapped_column(LargeBinary)  # یک بایت وضعیت برای هر گروهِ دسته‌ی جاری
+    sent: Mapped[int] = mapped_column(default=0)
+    failed: Mapped[int] = mapped_column(default=0)
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+
+    period: Mapped[str] = mapped_column(String(10), primary_key=True)  # روز به شکل YYYY-MM-DD یا total
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0)
+
+class ActiveGroup(Base):
+    __tablename__ = "active_groups"
+
+    day: Mapped[str] = mapped_column(String(10), primary_key=True)
+    group_id: Mapped[str] = mapped_column(String(255), primary_key=True)
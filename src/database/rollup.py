@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import engine
+from .writer import writer
+from . import models
+
+# Counters are kept per UTC day and once more under this period for all time.
+TOTAL = "total"
+ACTIVE_GROUPS = "active_groups"
+CHUNK_SIZE = 500
+
+counters = models.StatCounter.__table__
+active_groups = models.ActiveGroup.__table__
+
+# One primary-key range read however long the history is: a row per counter for the day and for all time.
+DASHBOARD = select(counters.c.period, counters.c.name, counters.c.value).where(
+    counters.c.period.in_([bindparam("day"), TOTAL])
+)
+
+
+def _day_of(now: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+
+class RollupBuffer:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._counts: dict[tuple[str, str], int] = {}
+        self._active: list[tuple[str, str]] = []
+        self._seen: set[str] = set()
+        self._day = ""
+        self._rollover = 0.0
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def day(self) -> str:
+        now = time.time()
+        if now >= self._rollover:
+            self._day = _day_of(now)
+            self._rollover = (now // 86400 + 1) * 86400
+            self._seen = set()
+        return self._day
+
+    def add(self, name: str, count: int = 1) -> None:
+        key = (self.day, name)
+        self._counts[key] = self._counts.get(key, 0) + count
+
+    def active(self, group_id: str) -> None:
+        # Only the first message of a group each day reaches the database; the rest stop at this set.
+        day = self.day
+        if group_id not in self._seen:
+            self._seen.add(group_id)
+            self._active.append((day, group_id))
+
+    def __len__(self) -> int:
+        return len(self._counts) + len(self._active)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._counts and not self._active:
+                return
+            counts, self._counts = self._counts, {}
+            active, self._active = self._active, []
+            try:
+                await writer.run(_write_rollup, counts, active)
+            except:
+                for key, value in counts.items():
+                    self._counts[key] = self._counts.get(key, 0) + value
+                self._active[:0] = active
+                raise
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"stats flush failed: {exc}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+def _insert():
+    return postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+
+
+async def _write_rollup(session: AsyncSession, counts: dict[tuple[str, str], int], active: list[tuple[str, str]]) -> None:
+    increments = dict(counts)
+    days: dict[str, list[str]] = {}
+    for day, group_id in active:
+        days.setdefault(day, []).append(group_id)
+    for day, group_ids in days.items():
+        # A group counts as active once per day across restarts and processes: only rows actually inserted add up.
+        for start in range(0, len(group_ids), CHUNK_SIZE):
+            rows = [{"day": day, "group_id": group_id} for group_id in group_ids[start:start + CHUNK_SIZE]]
+            result = await session.execute(_insert()(active_groups).values(rows).on_conflict_do_nothing())
+            if result.rowcount:
+                key = (day, ACTIVE_GROUPS)
+                increments[key] = increments.get(key, 0) + result.rowcount
+    if days:
+        # Past days are already counted; their membership rows are no longer needed.
+        await session.execute(delete(active_groups).where(active_groups.c.day < min(days)))
+    for (_, name), value in counts.items():
+        key = (TOTAL, name)
+        increments[key] = increments.get(key, 0) + value
+    rows = [{"period": period, "name": name, "value": value} for (period, name), value in increments.items()]
+    for start in range(0, len(rows), CHUNK_SIZE):
+        stmt = _insert()(counters).values(rows[start:start + CHUNK_SIZE])
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[counters.c.period, counters.c.name],
+                set_={"value": counters.c.value + stmt.excluded.value},
+            )
+        )
+
+
+async def get_dashboard(session: AsyncSession, day: str) -> tuple[dict[str, int], dict[str, int]]:
+    conn = await session.connection()
+    today, total = {}, {}
+    for period, name, value in await conn.execute(DASHBOARD, {"day": day}):
+        (total if period == TOTAL else today)[name] = value
+    return today, total
+
+
+stats = RollupBuffer(interval=float(os.getenv("STATS_FLUSH_INTERVAL", "10")))
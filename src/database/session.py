@@ -1,16 +1,27 @@
 # src/database/session.py
+import asyncio
 from contextlib import asynccontextmanager
-from sqlalchemy.ext.asyncio import async_sessionmaker
-from .config import engine
+from contextvars import ContextVar
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from .config import engine, read_engine
 
 SessionLocal = async_sessionmaker(
     bind=engine,
     expire_on_commit=False,
 )
 
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    expire_on_commit=False,
+)
+
+# The session the running task has open, so a write can share its connection instead of taking a second one.
+_current: ContextVar[tuple[asyncio.Task, AsyncSession] | None] = ContextVar("current_session", default=None)
+
 @asynccontextmanager
-async def async_session():
-    session = SessionLocal()
+async def _session_scope(factory: async_sessionmaker):
+    session = factory()
+    token = _current.set((asyncio.current_task(), session))
     try:
         yield session
         await session.commit()
@@ -18,4 +29,33 @@ async def async_session():
         await session.rollback()
         raise
     finally:
-        await session.close()
\ No newline at end of file
+        _current.reset(token)
+        await session.close()
+        _after_commit(session)
+
+def _after_commit(session: AsyncSession) -> None:
+    for callback in session.info.pop("after_commit", ()):
+        callback()
+
+def current_session() -> AsyncSession | None:
+    # Tasks spawned inside a scope inherit the variable; only the task that opened the session may use it.
+    entry = _current.get()
+    if entry is None or entry[0] is not asyncio.current_task():
+        return None
+    return entry[1]
+
+async def commit(session: AsyncSession) -> None:
+    try:
+        await session.commit()
+    except:
+        await session.rollback()
+        raise
+    finally:
+        _after_commit(session)
+
+def async_session():
+    # Read-only in single-writer mode; mutations go through database.writer.
+    return _session_scope(ReadSessionLocal)
+
+def write_session():
+    return _session_scope(SessionLocal)
@@ -0,0 +1,95 @@
+import asyncio
+import os
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from .config import engine
+from .writer import writer
+from . import models
+
+# Keeps each multi-row INSERT under SQLite's bound parameter limit.
+CHUNK_SIZE = 500
+
+
+class UserUpsertBuffer:
+    def __init__(self, max_size: int, interval: float):
+        self.max_size = max_size
+        self.interval = interval
+        self._pending: dict[str, tuple[str, str | None]] = {}
+        self._user_ids: set[str] = set()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    def add(self, chat_id: str, user_id: str, username: str | None) -> None:
+        previous = self._pending.get(chat_id)
+        if not username and previous:
+            username = previous[1]
+        self._pending[chat_id] = (user_id, username or None)
+        self._user_ids.add(user_id)
+        if len(self._pending) >= self.max_size:
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def ensure_flushed(self, user_id: str) -> None:
+        if user_id in self._user_ids:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            rows = [
+                {"chat_id": chat_id, "user_id": user_id, "username": username}
+                for chat_id, (user_id, username) in batch.items()
+            ]
+            try:
+                await writer.run(_write_rows, rows)
+            except:
+                for chat_id, value in batch.items():
+                    self._pending.setdefault(chat_id, value)
+                raise
+            finally:
+                self._user_ids = {user_id for user_id, _ in self._pending.values()}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"user buffer flush failed: {exc}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+async def _write_rows(session, rows: list[dict]) -> None:
+    for start in range(0, len(rows), CHUNK_SIZE):
+        await session.execute(_upsert_statement(rows[start:start + CHUNK_SIZE]))
+
+
+def _upsert_statement(rows: list[dict]):
+    insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(models.User).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.User.chat_id],
+        set_={"username": func.coalesce(stmt.excluded.username, models.User.username)},
+    )
+
+
+user_buffer = UserUpsertBuffer(
+    max_size=int(os.getenv("USER_BUFFER_SIZE", "500")),
+    interval=float(os.getenv("USER_FLUSH_INTERVAL", "2")),
+)
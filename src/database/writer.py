@@ -0,0 +1,103 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable
+from .config import SINGLE_WRITER
+from .session import commit, current_session, write_session
+
+WriteFn = Callable[..., Awaitable[Any]]
+
+
+class SingleWriter:
+    def __init__(self, max_batch: int, enabled: bool):
+        self.max_batch = max_batch
+        self.enabled = enabled
+        self.batches = 0
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        # Commit whatever is already queued before shutting down.
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def run(self, fn: WriteFn, *args, **kwargs) -> Any:
+        if self._task is None:
+            session = current_session() if not self.enabled else None
+            if session is None:
+                async with write_session() as session:
+                    return await fn(session, *args, **kwargs)
+            # Reads and writes share one engine with the mode off: write on the caller's connection
+            # rather than holding two per handler, and commit so the write is durable on return.
+            try:
+                result = await fn(session, *args, **kwargs)
+            except:
+                await session.rollback()
+                raise
+            await commit(session)
+            return result
+        if asyncio.current_task() is self._task:
+            raise RuntimeError(f"{fn.__name__} called writer.run from inside a write")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((fn, args, kwargs, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._commit(batch)
+            if stopping:
+                return
+
+    async def _commit(self, batch: list[tuple[WriteFn, tuple, dict, asyncio.Future]]) -> None:
+        try:
+            async with write_session() as session:
+                results = [await fn(session, *args, **kwargs) for fn, args, kwargs, _ in batch]
+        except Exception as exc:
+            if len(batch) == 1:
+                self._settle(batch[0][3], None, exc)
+                return
+            # Something in the group failed; replay one transaction per write so only the culprit fails.
+            for item in batch:
+                await self._commit([item])
+            return
+        self.batches += 1
+        # Callers only hear back once their write is durable.
+        for (_, _, _, future), result in zip(batch, results):
+            self._settle(future, result, None)
+
+    @staticmethod
+    def _settle(future: asyncio.Future, result: Any, exc: Exception | None) -> None:
+        if future.done():
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+
+writer = SingleWriter(
+    max_batch=int(os.getenv("DB_WRITE_BATCH", "64")),
+    enabled=SINGLE_WRITER,
+)
@@ -0,0 +1,119 @@
+import os
+import time
+from array import array
+
+from rubpy.bot import filters
+from rubpy.bot.models import Update
+
+EMPTY = float("-inf")
+
+
+class FloodDetector:
+    """The last `limit` message times of each (group, sender), in preallocated arrays.
+
+    Each tracked sender owns a fixed slot of `limit` floats used as a ring buffer; a
+    message floods when the time it overwrites (the limit-th most recent) is still
+    inside the window. A clock hand sweeps a few slots per new sender, freeing those
+    idle for `idle` seconds, and at `capacity` the least recently active slot it saw
+    is reused, so every call is O(1) and memory stays bounded (about 22 MB at 100k senders).
+    """
+
+    def __init__(self, limit: int, window: float, idle: float, capacity: int, sweep: int = 8):
+        self.limit = max(2, min(limit, 255))
+        self.window = window
+        self.idle = max(idle, window)
+        self.capacity = max(1, capacity)
+        self.sweep = sweep
+        self.flagged = 0
+        self.evicted = 0
+        self._times = array("d", [EMPTY]) * (self.capacity * self.limit)
+        self._heads = bytearray(self.capacity)
+        self._owners = array("q", [0]) * self.capacity
+        self._used = bytearray(self.capacity)
+        self._free = array("l", range(self.capacity - 1, -1, -1))
+        self._hand = 0
+        # A 64-bit hash keys the index so it doesn't keep every sender's id strings alive.
+        self._index: dict[int, int] = {}
+        self._blank = array("d", [EMPTY]) * self.limit
+
+    def hit(self, group_id: str, sender_id: str, now: float) -> bool:
+        key = hash((group_id, sender_id))
+        slot = self._index.get(key)
+        if slot is None:
+            slot = self._claim(key, now)
+        head = self._heads[slot]
+        position = slot * self.limit + head
+        oldest = self._times[position]
+        self._times[position] = now
+        self._heads[slot] = head + 1 if head + 1 < self.limit else 0
+        if now - oldest < self.window:
+            self.flagged += 1
+            return True
+        return False
+
+    def clear(self) -> None:
+        for slot in list(self._index.values()):
+            self._release(slot)
+
+    def forget(self, group_id: str, sender_id: str) -> None:
+        slot = self._index.get(hash((group_id, sender_id)))
+        if slot is not None:
+            self._release(slot)
+
+    def _last_seen(self, slot: int) -> float:
+        head = self._heads[slot]
+        return self._times[slot * self.limit + (head - 1 if head else self.limit - 1)]
+
+    def _release(self, slot: int) -> None:
+        del self._index[self._owners[slot]]
+        self._used[slot] = 0
+        self._free.append(slot)
+
+    def _claim(self, key: int, now: float) -> int:
+        victim, victim_seen = -1, now
+        for _ in range(min(self.sweep, self.capacity)):
+            slot = self._hand
+            self._hand = slot + 1 if slot + 1 < self.capacity else 0
+            if not self._used[slot]:
+                continue
+            seen = self._last_seen(slot)
+            if now - seen >= self.idle:
+                self._release(slot)
+                self.evicted += 1
+            elif seen <= victim_seen:
+                victim, victim_seen = slot, seen
+        if not self._free:
+            # Full and nothing idle nearby: the least recently active sender seen gives up its slot.
+            self._release(victim)
+            self.evicted += 1
+        slot = self._free.pop()
+        start = slot * self.limit
+        self._times[start:start + self.limit] = self._blank
+        self._heads[slot] = 0
+        self._owners[slot] = key
+        self._used[slot] = 1
+        self._index[key] = slot
+        return slot
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+ACTION = os.getenv("FLOOD_ACTION", "delete")
+
+detector = FloodDetector(
+    limit=int(os.getenv("FLOOD_LIMIT", "5")),
+    window=float(os.getenv("FLOOD_WINDOW", "3")),
+    idle=float(os.getenv("FLOOD_IDLE", "60")),
+    capacity=int(os.getenv("FLOOD_CAPACITY", "100000")),
+)
+
+
+class flooding(filters.Filter):
+    """Matches group messages from a sender over the limit; whether the group has the lock is up to the handler."""
+
+    async def check(self, update: Update) -> bool:
+        message = getattr(update, "new_message", None)
+        if message is None or not message.sender_id:
+            return False
+        return detector.hit(update.chat_id, message.sender_id, time.monotonic())
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+
+import aiohttp
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        # Half-open: once the cool-down has passed a single probe goes through; the rest wait for its result.
+        if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class JokeFeed:
+    def __init__(self, url: str, buffer_size: int, timeout: float, breaker: CircuitBreaker):
+        self.url = url
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        self.breaker = breaker
+        self.buffer: deque[str] = deque(maxlen=buffer_size)
+        self.fallback: deque[str] = deque(maxlen=buffer_size * 5)
+        self.session: aiohttp.ClientSession | None = None
+        self._wanted = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=4, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        if self._task is None:
+            self._task = asyncio.create_task(self._prefetch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def fetch(self) -> str:
+        if not self.breaker.allow():
+            raise CircuitOpen("joke upstream circuit is open")
+        try:
+            async with self.session.get(self.url) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+            text = data["text"]
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # A probe cut short (say, by stop()) must not hold the circuit half-open for good.
+            self.breaker.probing = False
+            raise
+        self.breaker.record_success()
+        self.fallback.append(text)
+        return text
+
+    async def _prefetch(self) -> None:
+        while True:
+            while len(self.buffer) < self.buffer_size:
+                try:
+                    self.buffer.append(await self.fetch())
+                except CircuitOpen:
+                    break
+                except Exception as exc:
+                    print(f"joke prefetch failed: {exc}")
+                    break
+            self._wanted.clear()
+            await self._wanted.wait()
+
+    async def get(self) -> str | None:
+        # Never waits on upstream: a miss wakes the prefetcher and answers with a joke already seen.
+        self._wanted.set()
+        if self.buffer:
+            return self.buffer.popleft()
+        if self.fallback:
+            return random.choice(self.fallback)
+        return None
+
+
+feed = JokeFeed(
+    url=os.getenv("JOKE_API_URL", "https://shython-apis.liara.run/joke/random"),
+    buffer_size=int(os.getenv("JOKE_BUFFER_SIZE", "20")),
+    timeout=float(os.getenv("JOKE_TIMEOUT", "5")),
+    breaker=CircuitBreaker(
+        threshold=int(os.getenv("JOKE_BREAKER_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv("JOKE_BREAKER_RESET", "60")),
+    ),
+)
@@ -4,7 +4,9 @@ from rubpy.bot.models import (
     Button,
     ButtonTypeEnum
 )
-def get_keyboard():
+from strings import get_string
+
+def get_keyboard(language: str | None = None):
     return Keypad(
         rows=[
             KeypadRow(
@@ -12,7 +14,7 @@ def get_keyboard():
                     Button(
                         id="pv_get_help",
                         type=ButtonTypeEnum.SIMPLE,
-                        button_text="🚀 راهنما"
+                        button_text=get_string("keypad_help", language)
                     ),
                 ]
             ),
@@ -21,11 +23,32 @@ def get_keyboard():
                     Button(
                         id="my_groups",
                         type=ButtonTypeEnum.SIMPLE,
-                        button_text="📋 گروه‌های من",
+                        button_text=get_string("keypad_my_groups", language),
                     )
                 ]
             )
         ],
         resize_keyboard=True,
         on_time_keyboard=False,
-    )
\ No newline at end of file
+    )
+
+def get_groups_keyboard(before: str | None, after: str | None, language: str | None = None):
+    # The button ids carry the keyset cursor of the page they lead to.
+    buttons = []
+    if before is not None:
+        buttons.append(
+            Button(
+                id=f"my_groups:prev:{before}",
+                type=ButtonTypeEnum.SIMPLE,
+                button_text=get_string("keypad_previous", language),
+            )
+        )
+    if after is not None:
+        buttons.append(
+            Button(
+                id=f"my_groups:next:{after}",
+                type=ButtonTypeEnum.SIMPLE,
+                button_text=get_string("keypad_next", language),
+            )
+        )
+    return Keypad(rows=[KeypadRow(buttons=buttons)]) if buttons else None
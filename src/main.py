@@ -1,32 +1,110 @@
 from rubpy.bot import BotClient, filters
-from rubpy.bot.models import Update
+from rubpy.bot.models import InlineMessage, Keypad, Update
 from dotenv import load_dotenv
+import asyncio
 import os
 import random
 import re
-import aiohttp
-import aiosqlite
-import json
-
-from strings import get_string
-from database import init_db, async_session
-from database import crud, models
-from sqlalchemy import select
+
+from strings import catalog, get_string
+from database import engine, init_db, async_session
+from database.config import read_engine
+from database import cache
+from database import crud, fastpath, models
+from database import rollup
+from database.rollup import stats
+from database.writebehind import user_buffer
+from database.writer import writer
 from keyboard import start
-from rubpy.bot.enums import ChatKeypadTypeEnum
+from sqlalchemy import func, select
+import broadcast
+import chats
+import flood
+import joke
+import metrics
+import moderation
+import outbound
+import quiz
+import responses
+import router
+import supervisor
+import workers
 
 load_dotenv()
 
 app = BotClient(
     token=os.getenv("BOT_TOKEN"),
-    rate_limit=float(os.getenv("RATE_LIMIT")),
+    # RATE_LIMIT and retries are handled by the outbound dispatcher, which orders sends by priority.
+    rate_limit=0,
+    max_retries=1,
     use_webhook=bool(os.getenv("USE_WEBHOOK"))
 )
 
+def register_metrics():
+    metrics.registry.instrument_engine(engine)
+    if read_engine is not engine:
+        metrics.registry.instrument_engine(read_engine)
+    metrics.registry.instrument_client(app)
+    metrics.registry.gauge(
+        "worker_queue_depth", "Updates waiting per worker shard.",
+        lambda: [({"shard": shard}, depth) for shard, depth in enumerate(workers.dispatcher.depths())],
+    )
+    metrics.registry.gauge(
+        "worker_dropped_total", "Low-priority updates shed by saturated shards.",
+        lambda: [({}, workers.dispatcher.dropped)], kind="counter",
+    )
+    metrics.registry.gauge(
+        "outbound_queue_depth", "Outbound calls waiting for a send slot, by priority.",
+        lambda: [({"priority": name}, depth) for name, depth in zip(outbound.PRIORITIES, outbound.dispatcher.queued)],
+    )
+    for name, help in (
+        ("sent", "Outbound calls that succeeded."),
+        ("failed", "Outbound calls that gave up."),
+        ("retried", "Outbound retries, including replies resent without reply_to."),
+        ("dropped", "Outbound replies shed under overload."),
+        ("coalesced", "Outbound replies merged into an identical pending one."),
+    ):
+        metrics.registry.gauge(
+            f"outbound_{name}_total", help,
+            lambda name=name: [({"priority": p}, n) for p, n in zip(outbound.PRIORITIES, getattr(outbound.dispatcher, name))],
+            kind="counter",
+        )
+    metrics.registry.histogram(
+        "outbound_queue_seconds", "Time from submit to first send attempt, by priority.",
+        lambda: [({"priority": name}, h) for name, h in zip(outbound.PRIORITIES, outbound.dispatcher.latency)],
+    )
+    metrics.registry.gauge("db_write_queue_depth", "Writes waiting for the single writer.", lambda: [({}, writer.depth())])
+    metrics.registry.gauge("user_buffer_pending", "User upserts waiting to be flushed.", lambda: [({}, len(user_buffer))])
+    metrics.registry.gauge("stats_pending", "Stat counters waiting to be flushed.", lambda: [({}, len(stats))])
+    metrics.registry.gauge("flood_tracked_senders", "Senders with a flood ring buffer.", lambda: [({}, len(flood.detector))])
+    metrics.registry.gauge(
+        "flood_flagged_total", "Messages over the flood limit, before lock and privilege checks.",
+        lambda: [({}, flood.detector.flagged)], kind="counter",
+    )
+    metrics.registry.gauge("joke_buffer_size", "Prefetched jokes.", lambda: [({}, len(joke.feed.buffer))])
+    metrics.registry.gauge(
+        "background_tasks", "Running broadcast jobs.", lambda: [({}, len(background_tasks))],
+    )
+    for name, store in (
+        ("group_settings", cache.group_settings),
+        ("privileged_members", cache.privileged_members),
+        ("group_status", cache.group_status),
+        ("user_groups", cache.user_groups),
+        ("chats", chats.cache),
+    ):
+        metrics.registry.gauge(
+            f"cache_{name}", f"{name} cache size, hits, misses.",
+            lambda store=store: [({"stat": stat}, value) for stat, value in store.stats().items()],
+        )
+
+group_router = router.CommandRouter()
+background_tasks: set[asyncio.Task] = set()
+
 ADD_OWNER_PATTERN = re.compile(r"^افزودن مالک\s+([A-Za-z0-9_]+)$")
 ADD_ADMIN_PATTERN = re.compile(r"^افزودن ادمین\s+([A-Za-z0-9_]+)$")
 REMOVE_OWNER_PATTERN = re.compile(r"^حذف مالک\s+(@?[A-Za-z0-9_]+)$")
 REMOVE_ADMIN_PATTERN = re.compile(r"^حذف ادمین\s+(@?[A-Za-z0-9_]+)$")
+LANGUAGE_PATTERN = re.compile(r"^زبان\s+([A-Za-z]{2,8})$")
 
 BOT_TEXT_RESPONSES = [
     "سلام! چی ازم میخوای؟ 😄",
@@ -38,38 +116,45 @@ BOT_TEXT_RESPONSES = [
     "ماموریت چیه رئیس؟ 💼",
     "چه خبر؟ آماده‌ام دست به کار بشم 💪"
 ]
+BOT_TEXT_REPLIES = [responses.Reply(text) for text in BOT_TEXT_RESPONSES]
+
+BROADCAST_USAGE = responses.Reply("لطفا پیام مورد نظر را بعد از دستور بنویسید.")
+BROADCAST_NOT_ALLOWED = responses.Reply("شما مجاز به استفاده از این دستور نیستید.")
+BROADCAST_NO_GROUPS = responses.Reply("هیچ گروهی برای ارسال پیام یافت نشد.")
+BROADCAST_STARTED = responses.Reply("در حال ارسال پیام...")
+
+STATS_MESSAGE = (
+    "📈 آمار ربات\n\n"
+    "📅 امروز ({day}):\n"
+    "➕ نصب: {installs_today}\n"
+    "👥 گروه‌های فعال: {active_groups}\n"
+    "🗑️ پیام‌های حذف‌شده: {deletes_today}\n"
+    "⛔ کاربران مسدودشده: {bans_today}\n\n"
+    "📊 از ابتدا:\n"
+    "➕ نصب: {installs_total}\n"
+    "🗑️ پیام‌های حذف‌شده: {deletes_total}\n"
+    "⛔ کاربران مسدودشده: {bans_total}\n\n"
+    "⌨️ پرکاربردترین دستورهای امروز:\n{commands}"
+)
 
-async def get_random_question():
-    database_path = "quiz.db"
-    query = "SELECT question, options, answer FROM questions ORDER BY RANDOM() LIMIT 1;"
-    async with aiosqlite.connect(database_path) as db:
-        async with db.execute(query) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                question, options_json, answer = row
-                options_data = json.loads(options_json)
-                options = [option["title"] for option in options_data]
-                correct_index: list = [
-                    option["id"] if option["id"] == answer else 0
-                    for option in options_data
-                ].index(answer)
-                return {
-                    "question": question.strip(),
-                    "options": options,
-                    "correct_index": correct_index,
-                }
-            return None
+def is_bot_admin(chat_id: str) -> bool:
+    allowed_ids_env = os.getenv("BROADCAST_ALLOWED_IDS")
+    if not allowed_ids_env:
+        return True
+    allowed_ids = {item.strip() for item in allowed_ids_env.split(",") if item.strip()}
+    return str(chat_id) in allowed_ids
 
 async def fetch_user_by_identifier(session, identifier: str) -> models.User | None:
     identifier = identifier.strip()
     if not identifier:
         return None
+    await user_buffer.flush()
     username = None
     if identifier.startswith("@"):
         username = identifier[1:]
     if username:
         result = await session.execute(
-            select(models.User).where(models.User.username == username)
+            select(models.User).where(func.lower(models.User.username) == username.lower())
         )
         user = result.scalar_one_or_none()
         if user:
@@ -88,476 +173,307 @@ async def fetch_user_by_identifier(session, identifier: str) -> models.User | No
 @app.on_start()
 async def on_start(client: BotClient):
     await init_db()
+    writer.start()
+    await quiz.bank.load()
+    await joke.feed.start()
+    user_buffer.start()
+    stats.start()
+    outbound.dispatcher.start()
+    workers.dispatcher.start(client)
+    await metrics.server.start()
+    # With several worker processes only the first one resumes unfinished broadcasts.
+    if not supervisor.worker_index:
+        async with async_session() as session:
+            jobs = await crud.get_running_broadcast_jobs(session)
+        for job in jobs:
+            spawn_broadcast_job(client, job)
     me = await client.get_me()
     print(me.username, "Bot started.")
 
+@app.on_shutdown()
+async def on_shutdown(client: BotClient):
+    await workers.dispatcher.stop()
+    await outbound.dispatcher.stop()
+    await metrics.server.stop()
+    await user_buffer.stop()
+    await stats.stop()
+    await writer.stop()
+    await joke.feed.stop()
+
 @app.on_update(filters.private() & filters.button("pv_get_help"))
 async def pv_get_help_handler(client: BotClient, update: Update):
-    chat = await client.get_chat(update.chat_id)
-    try:
-        await update.reply(
-            text=get_string("pv_start").format(chat.first_name),
-            chat_keypad=start.get_keyboard(),
-            chat_keypad_type=ChatKeypadTypeEnum.NEW)
-    except Exception as exc:
-        await client.send_message(
-            chat_id=update.chat_id,
-            text=get_string("pv_start").format(chat.first_name),
-            chat_keypad=start.get_keyboard(),
-            chat_keypad_type=ChatKeypadTypeEnum.NEW)
-        print(f"pv_get_help_handler failed: {exc}")
+    chat = await chats.get_chat(client, update.chat_id)
+    async with async_session() as session:
+        language = await fastpath.get_user_language(session, update.chat_id)
+    await responses.answer(client, update, responses.start_menu(get_string("pv_start", language).format(chat.first_name), language))
+
+MY_GROUPS_PAGE_SIZE = int(os.getenv("MY_GROUPS_PAGE_SIZE", "10"))
+ROLE_KEYS = ("role_main_owner", "role_owner", "role_admin")
+
+def render_groups(page: cache.GroupPage, language: str | None) -> tuple[str, Keypad | None]:
+    if not page.groups:
+        return get_string("my_groups_empty", language), None
+    untitled = get_string("my_groups_untitled", language)
+    roles = [get_string(key, language) for key in ROLE_KEYS]
+    line = get_string("my_groups_line", language)
+    lines = [get_string("my_groups_header", language) + "\n"] + [
+        line.format(title=title or untitled, chat_id=chat_id, role=roles[rank]) for chat_id, title, rank in page.groups
+    ]
+    return "\n".join(lines), start.get_groups_keyboard(page.before, page.after, language)
 
 @app.on_update(filters.private() & filters.button("my_groups"))
 async def my_groups_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        result = await session.execute(
-            select(models.Group)
-            .join(models.Group.owner)
-            .where(models.User.user_id == update.new_message.sender_id)
-        )
-        groups = result.scalars().all()
-    if not groups:
-        message = get_string("my_groups_empty")
-    else:
-        lines = [get_string("my_groups_header") + "\n"] + [f"{group.title or 'بدون نام'} ({group.chat_id})" for group in groups]
-        message = "\n".join(lines)
-    
-    try:
-        await update.reply(
-            text=message,
-            chat_keypad=start.get_keyboard(),
-            chat_keypad_type=ChatKeypadTypeEnum.NEW)
-    except Exception as exc:
-        await client.send_message(
-            chat_id=update.chat_id,
-            text=message,
-            chat_keypad=start.get_keyboard(),
-            chat_keypad_type=ChatKeypadTypeEnum.NEW)
-        print(f"my_groups_handler failed: {exc}")
+        page = await fastpath.get_user_groups(session, update.new_message.sender_id, "next", "", MY_GROUPS_PAGE_SIZE)
+        language = await fastpath.get_user_language(session, update.chat_id)
+    message, keypad = render_groups(page, language)
+    await responses.answer(client, update, responses.start_menu(message, language).with_inline_keypad(keypad))
+
+@app.on_update(filters.private() & filters.button(r"my_groups:(next|prev):(.*)", regex=True))
+async def my_groups_page_handler(client: BotClient, update: InlineMessage):
+    direction, cursor = update.external_data["match"].groups()
+    async with async_session() as session:
+        page = await fastpath.get_user_groups(session, update.sender_id, direction, cursor, MY_GROUPS_PAGE_SIZE)
+        language = await fastpath.get_user_language(session, update.chat_id)
+    message, keypad = render_groups(page, language)
+    await responses.edit(client, update.chat_id, update.message_id, responses.text(message).with_inline_keypad(keypad))
 
 @app.on_update(filters.private() & filters.commands("start"))
 async def pv_start(client: BotClient, update: Update):
+    get_chat = await chats.get_chat(client, update.chat_id)
+    user_buffer.add(
+        chat_id=update.chat_id,
+        user_id=update.new_message.sender_id,
+        username=get_chat.username,
+    )
+    if supervisor.PROCESSES > 1:
+        # The user's group is likely owned by another worker, whose reads can't see this process's buffer.
+        await user_buffer.flush()
     async with async_session() as session:
-        get_chat = await client.get_chat(update.chat_id)
-        await crud.upsert_user(
-            session,
-            chat_id=update.chat_id,
-            user_id=update.new_message.sender_id,
-            username=get_chat.username,
-        )
-    try:
-        await update.reply(
-            text=get_string("pv_start").format(get_chat.first_name),
-            chat_keypad=start.get_keyboard(),
-            chat_keypad_type=ChatKeypadTypeEnum.NEW)
-    except Exception as exc:
-        await client.send_message(
-            chat_id=update.chat_id,
-            text=get_string("pv_start").format(get_chat.first_name),
-            chat_keypad=start.get_keyboard(),
-            chat_keypad_type=ChatKeypadTypeEnum.NEW)
-        print(f"pv_start failed: {exc}")
-
-@app.on_update(filters.group() & filters.text("نصب"))
+        language = await fastpath.get_user_language(session, update.chat_id)
+    await responses.answer(client, update, responses.start_menu(get_string("pv_start", language).format(get_chat.first_name), language))
+
+@group_router.text("نصب")
 async def install_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        owner = result.scalar_one_or_none()
-
-        if owner is None:
-            return await update.reply(get_string("gp_install_failed"))
-
-        get_chat = await client.get_chat(update.chat_id)
-        group, status = await crud.upsert_group(
-            session,
-            group_id=update.chat_id,
-            title=get_chat.title,
-            owner=owner,
-        )
-        await crud.ensure_group_role(session, group.chat_id, owner.user_id, "owner")
-        
-        if status == "Exist":
-            return
+        owner = await fastpath.get_user(session, update.new_message.sender_id)
 
-        await crud.log_install(session, group, owner)
+    if owner is None:
+        return await responses.answer(client, update, responses.static("gp_install_failed"))
 
-    try:
-        await update.reply(get_string("gp_install"))
-    except Exception as exc:
-        await client.send_message(chat_id=update.chat_id, text=get_string("gp_install"))
-        print(f"install_handler failed: {exc}")
-
-@app.on_update(filters.group() & filters.forward())
-async def forward_handler(client: BotClient, update: Update):
-    async with async_session() as session:
-        result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = result.scalar_one_or_none()
-        if group is None:
-            return
-        if not group.forward_lock:
-            return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
-        is_privileged = False
-        if sender:
-            if group.owner_id == sender.chat_id:
-                is_privileged = True
-            else:
-                is_owner_role = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
-                is_admin_role = await crud.user_has_role(session, group.chat_id, sender.user_id, "admin")
-                is_privileged = is_owner_role or is_admin_role
-        if is_privileged:
-            return
-        await update.delete()
+    get_chat = await chats.get_chat(client, update.chat_id)
+    status = await writer.run(crud.install_group, update.chat_id, get_chat.title, owner.chat_id)
+    if status == "Exist":
+        return
 
-@app.on_update(filters.group() & filters.text(r"(?i)\b((?:https?://|www\.)[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?)+(?:[/?#][^\s]*)?)", regex=True))
-async def link_handler(client: BotClient, update: Update):
-    async with async_session() as session:
-        result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = result.scalar_one_or_none()
-        if group is None:
-            return
-        if not group.link_lock:
-            return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
-        is_privileged = False
-        if sender:
-            if group.owner_id == sender.chat_id:
-                is_privileged = True
-            else:
-                is_owner_role = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
-                is_admin_role = await crud.user_has_role(session, group.chat_id, sender.user_id, "admin")
-                is_privileged = is_owner_role or is_admin_role
-        if is_privileged:
-            return
-        await update.delete()
+    stats.add("installs")
+    await responses.answer(client, update, responses.static("gp_install"))
 
-@app.on_update(filters.group() & filters.text(r"(?i)(?<!\w)@(?:[a-z0-9_]{3,32})(?!\w)", regex=True))
-async def username_handler(client: BotClient, update: Update):
-    async with async_session() as session:
-        result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = result.scalar_one_or_none()
-        if group is None:
-            return
-        if not group.username_lock:
-            return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
-        is_privileged = False
-        if sender:
-            if group.owner_id == sender.chat_id:
-                is_privileged = True
-            else:
-                is_owner_role = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
-                is_admin_role = await crud.user_has_role(session, group.chat_id, sender.user_id, "admin")
-                is_privileged = is_owner_role or is_admin_role
-        if is_privileged:
-            return
-        await update.delete()
-
-@app.on_update(filters.group() & filters.text("قفل لینک"))
+@group_router.text("قفل لینک")
 async def lock_link_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("lock_link_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("lock_link_not_allowed"))
+            return await responses.answer(client, update, responses.static("lock_link_not_allowed", group.language))
         if group.link_lock:
-            try:
-                return await update.reply(get_string("lock_link_already_enabled"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("lock_link_already_enabled"))
-        await crud.update_group_locks(session, group.chat_id, link_lock=True)
-        try:
-            await update.reply(get_string("lock_link_enabled"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("lock_link_enabled"))
-            print(f"lock_link_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("lock_link_already_enabled", group.language))
+        await writer.run(crud.update_group_locks, group.chat_id, link_lock=True)
+        await responses.answer(client, update, responses.static("lock_link_enabled", group.language))
 
-@app.on_update(filters.group() & filters.text("باز کردن لینک"))
+@group_router.text("باز کردن لینک")
 async def unlock_link_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("unlock_link_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("unlock_link_not_allowed"))
+            return await responses.answer(client, update, responses.static("unlock_link_not_allowed", group.language))
         if not group.link_lock:
-            try:
-                return await update.reply(get_string("unlock_link_already_disabled"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("unlock_link_already_disabled"))
-        await crud.update_group_locks(session, group.chat_id, link_lock=False)
-        try:
-            await update.reply(get_string("unlock_link_disabled"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("unlock_link_disabled"))
-            print(f"unlock_link_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("unlock_link_already_disabled", group.language))
+        await writer.run(crud.update_group_locks, group.chat_id, link_lock=False)
+        await responses.answer(client, update, responses.static("unlock_link_disabled", group.language))
 
-@app.on_update(filters.group() & filters.text("قفل یوزرنیم"))
+@group_router.text("قفل یوزرنیم")
 async def lock_username_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("lock_username_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("lock_username_not_allowed"))
+            return await responses.answer(client, update, responses.static("lock_username_not_allowed", group.language))
         if group.username_lock:
-            try:
-                return await update.reply(get_string("lock_username_already_enabled"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("lock_username_already_enabled"))
-        await crud.update_group_locks(session, group.chat_id, username_lock=True)
-        try:
-            await update.reply(get_string("lock_username_enabled"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("lock_username_enabled"))
-            print(f"lock_username_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("lock_username_already_enabled", group.language))
+        await writer.run(crud.update_group_locks, group.chat_id, username_lock=True)
+        await responses.answer(client, update, responses.static("lock_username_enabled", group.language))
 
-@app.on_update(filters.group() & filters.text("باز کردن یوزرنیم"))
+@group_router.text("باز کردن یوزرنیم")
 async def unlock_username_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("unlock_username_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("unlock_username_not_allowed"))
+            return await responses.answer(client, update, responses.static("unlock_username_not_allowed", group.language))
         if not group.username_lock:
-            try:
-                return await update.reply(get_string("unlock_username_already_disabled"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("unlock_username_already_disabled"))
-        await crud.update_group_locks(session, group.chat_id, username_lock=False)
-        try:
-            await update.reply(get_string("unlock_username_disabled"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("unlock_username_disabled"))
-            print(f"unlock_username_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("unlock_username_already_disabled", group.language))
+        await writer.run(crud.update_group_locks, group.chat_id, username_lock=False)
+        await responses.answer(client, update, responses.static("unlock_username_disabled", group.language))
 
-@app.on_update(filters.group() & filters.text("قفل فروارد"))
+@group_router.text("قفل فروارد")
 async def lock_forward_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("lock_forward_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("lock_forward_not_allowed"))
+            return await responses.answer(client, update, responses.static("lock_forward_not_allowed", group.language))
         if group.forward_lock:
-            try:
-                return await update.reply(get_string("lock_forward_already_enabled"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("lock_forward_already_enabled"))
-        await crud.update_group_locks(session, group.chat_id, forward_lock=True)
-        try:
-            await update.reply(get_string("lock_forward_enabled"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("lock_forward_enabled"))
-            print(f"lock_forward_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("lock_forward_already_enabled", group.language))
+        await writer.run(crud.update_group_locks, group.chat_id, forward_lock=True)
+        await responses.answer(client, update, responses.static("lock_forward_enabled", group.language))
 
-@app.on_update(filters.group() & filters.text("باز کردن فروارد"))
+@group_router.text("باز کردن فروارد")
 async def unlock_forward_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("unlock_forward_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("unlock_forward_not_allowed"))
+            return await responses.answer(client, update, responses.static("unlock_forward_not_allowed", group.language))
         if not group.forward_lock:
-            try:
-                return await update.reply(get_string("unlock_forward_already_disabled"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("unlock_forward_already_disabled"))
-        await crud.update_group_locks(session, group.chat_id, forward_lock=False)
-        try:
-            await update.reply(get_string("unlock_forward_disabled"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("unlock_forward_disabled"))
-            print(f"unlock_forward_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("unlock_forward_already_disabled", group.language))
+        await writer.run(crud.update_group_locks, group.chat_id, forward_lock=False)
+        await responses.answer(client, update, responses.static("unlock_forward_disabled", group.language))
 
-@app.on_update(filters.group() & filters.text("وضعیت"))
-async def status_handler(client: BotClient, update: Update):
+@group_router.text("قفل فلود")
+async def lock_flood_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        allowed = False
-        if group.owner_id == sender.chat_id:
-            allowed = True
-        else:
-            is_owner_role = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
-            is_admin_role = await crud.user_has_role(session, group.chat_id, sender.user_id, "admin")
-            allowed = is_owner_role or is_admin_role
-        if not allowed:
-            try:
-                return await update.reply(get_string("status_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("status_not_allowed"))
-        owner_main = None
-        if group.owner_id:
-            owner_query = await session.execute(
-                select(models.User).where(models.User.chat_id == group.owner_id)
-            )
-            owner_main = owner_query.scalar_one_or_none()
-        roles_result = await session.execute(select(models.GroupRole).where(models.GroupRole.group_id == group.chat_id))
-        roles = roles_result.scalars().all()
-        owner_ids = [role.user_id for role in roles if role.role == "owner"]
-        admin_ids = [role.user_id for role in roles if role.role == "admin"]
-        lookup_ids = list({*owner_ids, *admin_ids})
-        users_map: dict[str, models.User] = {}
-        if lookup_ids:
-            users_result = await session.execute(select(models.User).where(models.User.user_id.in_(lookup_ids)))
-            users = users_result.scalars().all()
-            users_map = {user.user_id: user for user in users}
-
-        unknown_text = get_string("status_unknown_user")
-
-        def format_user(user: models.User | None, fallback: str) -> str:
-            if user is None:
-                return fallback
-            if user.username:
-                return f"@{user.username}"
-            if user.user_id:
-                return user.user_id
-            return user.chat_id
-
-        main_owner_id = owner_main.user_id if owner_main else None
-        additional_owner_ids = [user_id for user_id in owner_ids if user_id != main_owner_id]
-        additional_owner_ids = list(dict.fromkeys(additional_owner_ids))
-        admin_ids = list(dict.fromkeys(admin_ids))
-        additional_owners = [format_user(users_map.get(user_id), user_id) for user_id in additional_owner_ids]
-        admins = [format_user(users_map.get(user_id), user_id) for user_id in admin_ids]
-        main_owner_text = format_user(owner_main, unknown_text)
-        if owner_main is None:
-            main_owner_text = unknown_text
-        additional_owner_text = ", ".join(additional_owners) if additional_owners else get_string("status_none")
-        admin_text = ", ".join(admins) if admins else get_string("status_none")
-        link_status = get_string("status_active") if group.link_lock else get_string("status_inactive")
-        username_status = get_string("status_active") if group.username_lock else get_string("status_inactive")
-        forward_status = get_string("status_active") if group.forward_lock else get_string("status_inactive")
-        message = get_string("status_message").format(
-            link_lock=link_status,
-            username_lock=username_status,
-            forward_lock=forward_status,
-            main_owner=main_owner_text,
-            additional_owners=additional_owner_text,
-            admins=admin_text,
-        )
-        try:
-            await update.reply(message)
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=message)
-            print(f"status_handler failed: {exc}")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
+        if not is_owner:
+            return await responses.answer(client, update, responses.static("lock_flood_not_allowed", group.language))
+        if group.flood_lock:
+            return await responses.answer(client, update, responses.static("lock_flood_already_enabled", group.language))
+        await writer.run(crud.update_group_locks, group.chat_id, flood_lock=True)
+        await responses.answer(client, update, responses.static("lock_flood_enabled", group.language))
+
+@group_router.text("باز کردن فلود")
+async def unlock_flood_handler(client: BotClient, update: Update):
+    async with async_session() as session:
+        group = await fastpath.get_group_settings(session, update.chat_id)
+        if group is None:
+            return
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
+        if sender is None:
+            return
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
+        if not is_owner:
+            return await responses.answer(client, update, responses.static("unlock_flood_not_allowed", group.language))
+        if not group.flood_lock:
+            return await responses.answer(client, update, responses.static("unlock_flood_already_disabled", group.language))
+        await writer.run(crud.update_group_locks, group.chat_id, flood_lock=False)
+        await responses.answer(client, update, responses.static("unlock_flood_disabled", group.language))
+
+def format_user(user: fastpath.UserRecord) -> str:
+    if user.username:
+        return f"@{user.username}"
+    if user.user_id:
+        return user.user_id
+    return user.chat_id
+
+def render_status(
+    group: cache.GroupSettings,
+    main_owner: fastpath.UserRecord | None,
+    owners: list[fastpath.UserRecord],
+    admins: list[fastpath.UserRecord],
+) -> responses.Reply:
+    language = group.language
+    active, inactive, none = (get_string(key, language) for key in ("status_active", "status_inactive", "status_none"))
+    message = get_string("status_message", language).format(
+        link_lock=active if group.link_lock else inactive,
+        username_lock=active if group.username_lock else inactive,
+        forward_lock=active if group.forward_lock else inactive,
+        flood_lock=active if group.flood_lock else inactive,
+        main_owner=format_user(main_owner) if main_owner else get_string("status_unknown_user", language),
+        additional_owners=", ".join(map(format_user, owners)) or none,
+        admins=", ".join(map(format_user, admins)) or none,
+    )
+    return responses.text(message)
 
-@app.on_update(filters.group() & filters.text("شناسه من"))
+@group_router.text("وضعیت")
+async def status_handler(client: BotClient, update: Update):
+    sender_id = update.new_message.sender_id
+    async with async_session() as session:
+        group = await fastpath.get_group_settings(session, update.chat_id)
+        if group is None:
+            return
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        if not members.is_privileged(sender_id):
+            if await fastpath.get_user(session, sender_id) is None:
+                return
+            return await responses.answer(client, update, responses.static("status_not_allowed", group.language))
+        # During a raid the same status is asked for over and over; it is rendered once per change.
+        reply = cache.group_status.get(group.chat_id)
+        if reply is cache.MISSING:
+            generation = cache.group_status.generation
+            reply = render_status(group, *await fastpath.get_status_members(session, group.chat_id))
+            cache.group_status.set(group.chat_id, reply, generation)
+    await responses.answer(client, update, reply)
+
+@group_router.text("شناسه من")
 async def get_me(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group:
-            try:
-                await update.reply(str(update.new_message.sender_id))
-            except Exception as exc:
-                await client.send_message(chat_id=update.chat_id, text=str(update.new_message.sender_id))
-                print(f"get_me_handler failed: {exc}")
+            await responses.answer(client, update, responses.text(str(update.new_message.sender_id)))
 
-@app.on_update(filters.group() & filters.text("راهنما"))
+@group_router.text("راهنما")
 async def help_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group:
-            try:
-                await update.reply(get_string("help_message"))
-            except Exception as exc:
-                await client.send_message(chat_id=update.chat_id, text=get_string("help_message"))
-                print(f"help_handler failed: {exc}")
+            await responses.answer(client, update, responses.static("help_message", group.language))
 
-@app.on_update(filters.group() & filters.text(r"^افزودن مالک\s+[A-Za-z0-9_]+$", regex=True))
+@group_router.prefix("افزودن مالک", ADD_OWNER_PATTERN)
 async def add_owner_handler(client: BotClient, update: Update):
     text = (update.new_message.text or "").strip()
     match = ADD_OWNER_PATTERN.match(text)
@@ -565,45 +481,26 @@ async def add_owner_handler(client: BotClient, update: Update):
         return
     target_user_id = match.group(1)
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("add_owner_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("add_owner_not_allowed"))
-        target_result = await session.execute(select(models.User).where(models.User.user_id == target_user_id))
-        target = target_result.scalar_one_or_none()
+            return await responses.answer(client, update, responses.static("add_owner_not_allowed", group.language))
+        target = await fastpath.get_user(session, target_user_id)
         if target is None:
-            try:
-                return await update.reply(get_string("user_must_start_bot"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("user_must_start_bot"))
-        already_owner = await crud.user_has_role(session, group.chat_id, target.user_id, "owner")
+            return await responses.answer(client, update, responses.static("user_must_start_bot", group.language))
+        already_owner = members.is_owner(target.user_id)
         if already_owner:
-            try:
-                return await update.reply(get_string("already_owner"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("already_owner"))
-        await crud.ensure_group_role(session, group.chat_id, target.user_id, "owner")
-        try:
-            await update.reply(get_string("owner_added"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("owner_added"))
-            print(f"add_owner_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("already_owner", group.language))
+        await writer.run(crud.ensure_group_role, group.chat_id, target.user_id, "owner")
+        await responses.answer(client, update, responses.static("owner_added", group.language))
 
-@app.on_update(filters.group() & filters.text(r"^افزودن ادمین\s+[A-Za-z0-9_]+$", regex=True))
+@group_router.prefix("افزودن ادمین", ADD_ADMIN_PATTERN)
 async def add_admin_handler(client: BotClient, update: Update):
     text = (update.new_message.text or "").strip()
     match = ADD_ADMIN_PATTERN.match(text)
@@ -611,45 +508,26 @@ async def add_admin_handler(client: BotClient, update: Update):
         return
     target_user_id = match.group(1)
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("add_admin_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("add_admin_not_allowed"))
-        target_result = await session.execute(select(models.User).where(models.User.user_id == target_user_id))
-        target = target_result.scalar_one_or_none()
+            return await responses.answer(client, update, responses.static("add_admin_not_allowed", group.language))
+        target = await fastpath.get_user(session, target_user_id)
         if target is None:
-            try:
-                return await update.reply(get_string("user_must_start_bot"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("user_must_start_bot"))
-        already_admin = await crud.user_has_role(session, group.chat_id, target.user_id, "admin")
+            return await responses.answer(client, update, responses.static("user_must_start_bot", group.language))
+        already_admin = target.user_id in members.admins
         if already_admin:
-            try:
-                return await update.reply(get_string("already_admin"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("already_admin"))
-        await crud.ensure_group_role(session, group.chat_id, target.user_id, "admin")
-        try:
-            await update.reply(get_string("admin_added"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("admin_added"))
-            print(f"add_admin_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("already_admin", group.language))
+        await writer.run(crud.ensure_group_role, group.chat_id, target.user_id, "admin")
+        await responses.answer(client, update, responses.static("admin_added", group.language))
 
-@app.on_update(filters.group() & filters.text(r"^حذف ادمین\s+[@A-Za-z0-9_]+$", regex=True))
+@group_router.prefix("حذف ادمین", REMOVE_ADMIN_PATTERN)
 async def remove_admin_handler(client: BotClient, update: Update):
     text = (update.new_message.text or "").strip()
     match = REMOVE_ADMIN_PATTERN.match(text)
@@ -657,49 +535,28 @@ async def remove_admin_handler(client: BotClient, update: Update):
         return
     target_identifier = match.group(1)
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("remove_admin_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("remove_admin_not_allowed"))
+            return await responses.answer(client, update, responses.static("remove_admin_not_allowed", group.language))
         target = await fetch_user_by_identifier(session, target_identifier)
         if target is None:
-            try:
-                return await update.reply(get_string("user_must_start_bot"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("user_must_start_bot"))
-        already_admin = await crud.user_has_role(session, group.chat_id, target.user_id, "admin")
+            return await responses.answer(client, update, responses.static("user_must_start_bot", group.language))
+        already_admin = target.user_id in members.admins
         if not already_admin:
-            try:
-                return await update.reply(get_string("admin_not_registered"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("admin_not_registered"))
-        removed = await crud.remove_group_role(session, group.chat_id, target.user_id, "admin")
+            return await responses.answer(client, update, responses.static("admin_not_registered", group.language))
+        removed = await writer.run(crud.remove_group_role, group.chat_id, target.user_id, "admin")
         if not removed:
-            try:
-                return await update.reply(get_string("remove_admin_error"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("remove_admin_error"))
-        try:
-            await update.reply(get_string("admin_removed"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("admin_removed"))
-            print(f"remove_admin_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("remove_admin_error", group.language))
+        await responses.answer(client, update, responses.static("admin_removed", group.language))
 
-@app.on_update(filters.group() & filters.text(r"^حذف مالک\s+[@A-Za-z0-9_]+$", regex=True))
+@group_router.prefix("حذف مالک", REMOVE_OWNER_PATTERN)
 async def remove_owner_handler(client: BotClient, update: Update):
     text = (update.new_message.text or "").strip()
     match = REMOVE_OWNER_PATTERN.match(text)
@@ -707,187 +564,258 @@ async def remove_owner_handler(client: BotClient, update: Update):
         return
     target_identifier = match.group(1)
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group is None:
             return
-        sender_result = await session.execute(select(models.User).where(models.User.user_id == update.new_message.sender_id))
-        sender = sender_result.scalar_one_or_none()
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
         if sender is None:
             return
-        is_owner = False
-        if group.owner_id == sender.chat_id:
-            is_owner = True
-        else:
-            is_owner = await crud.user_has_role(session, group.chat_id, sender.user_id, "owner")
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        is_owner = members.is_owner(sender.user_id)
         if not is_owner:
-            try:
-                return await update.reply(get_string("remove_owner_not_allowed"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("remove_owner_not_allowed"))
+            return await responses.answer(client, update, responses.static("remove_owner_not_allowed", group.language))
         target = await fetch_user_by_identifier(session, target_identifier)
         if target is None:
-            try:
-                return await update.reply(get_string("user_must_start_bot"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("user_must_start_bot"))
+            return await responses.answer(client, update, responses.static("user_must_start_bot", group.language))
         if group.owner_id == target.chat_id:
-            try:
-                return await update.reply(get_string("cannot_remove_primary_owner"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("cannot_remove_primary_owner"))
-        already_owner = await crud.user_has_role(session, group.chat_id, target.user_id, "owner")
+            return await responses.answer(client, update, responses.static("cannot_remove_primary_owner", group.language))
+        already_owner = members.is_owner(target.user_id)
         if not already_owner:
-            try:
-                return await update.reply(get_string("owner_not_registered"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("owner_not_registered"))
-        removed = await crud.remove_group_role(session, group.chat_id, target.user_id, "owner")
+            return await responses.answer(client, update, responses.static("owner_not_registered", group.language))
+        removed = await writer.run(crud.remove_group_role, group.chat_id, target.user_id, "owner")
         if not removed:
-            try:
-                return await update.reply(get_string("remove_owner_error"))
-            except Exception as exc:
-                return await client.send_message(chat_id=update.chat_id, text=get_string("remove_owner_error"))
-        try:
-            await update.reply(get_string("owner_removed"))
-        except Exception as exc:
-            await client.send_message(chat_id=update.chat_id, text=get_string("owner_removed"))
-            print(f"remove_owner_handler failed: {exc}")
+            return await responses.answer(client, update, responses.static("remove_owner_error", group.language))
+        await responses.answer(client, update, responses.static("owner_removed", group.language))
 
-@app.on_update(filters.group() & filters.text(r"بات|ربات|نیون", regex=True))
-async def bot_text_handler(client: BotClient, update: Update):
+@group_router.prefix("زبان", LANGUAGE_PATTERN)
+async def language_handler(client: BotClient, update: Update):
+    text = (update.new_message.text or "").strip()
+    match = LANGUAGE_PATTERN.match(text)
+    if match is None:
+        return
+    language = match.group(1).lower()
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
-        if group:
-            try:
-                await update.reply(random.choice(BOT_TEXT_RESPONSES))
-            except Exception as exc:
-                await client.send_message(chat_id=update.chat_id, text=random.choice(BOT_TEXT_RESPONSES))
-                print(f"bot_text_handler failed: {exc}")
+        group = await fastpath.get_group_settings(session, update.chat_id)
+        if group is None:
+            return
+        sender = await fastpath.get_user(session, update.new_message.sender_id)
+        if sender is None:
+            return
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+    if not members.is_owner(sender.user_id):
+        return await responses.answer(client, update, responses.static("language_not_allowed", group.language))
+    if language not in catalog.languages:
+        message = get_string("language_unknown", group.language).format(languages=", ".join(catalog.languages))
+        return await responses.answer(client, update, responses.text(message))
+    await writer.run(crud.set_group_language, group.chat_id, language)
+    message = get_string("language_set", language).format(language=get_string("language_name", language))
+    await responses.answer(client, update, responses.text(message))
+
+@group_router.guard(flood.flooding())
+async def flood_handler(client: BotClient, update: Update):
+    sender_id = update.new_message.sender_id
+    async with async_session() as session:
+        group = await fastpath.get_group_settings(session, update.chat_id)
+        if group is None or not group.flood_lock:
+            return router.PASS
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        if members.is_privileged(sender_id):
+            return router.PASS
+    await outbound.dispatcher.delete(client, update.chat_id, update.message_id)
+    stats.add("deletes")
+    if flood.ACTION == "ban":
+        # The bot API has no mute; banning is the strongest action available.
+        flood.detector.forget(update.chat_id, sender_id)
+        stats.add("bans")
+        await outbound.dispatcher.submit(
+            client, outbound.DELETE, update.chat_id, "banChatMember", {"chat_id": update.chat_id, "user_id": sender_id}
+        )
 
-@app.on_update(filters.group() & filters.text("جوک"))
+@group_router.guard(moderation.violation())
+async def moderation_handler(client: BotClient, update: Update):
+    flags = update.external_data["moderation"]
+    async with async_session() as session:
+        group = await fastpath.get_group_settings(session, update.chat_id)
+        if group is None or not flags & moderation.locked(group):
+            return router.PASS
+        members = await fastpath.get_privileged_members(session, group.chat_id)
+        if members.is_privileged(update.new_message.sender_id):
+            return router.PASS
+    await outbound.dispatcher.delete(client, update.chat_id, update.message_id)
+    stats.add("deletes")
+
+@workers.dispatcher.low_priority
+@group_router.scan(filters.text(r"بات|ربات|نیون", regex=True))
 async def bot_text_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group:
-            async with aiohttp.ClientSession() as session:
-                async with session.get("https://shython-apis.liara.run/joke/random") as response:
-                    data = await response.json()
-                    try:
-                        await update.reply(data["text"])
-                    except Exception as exc:
-                        await client.send_message(chat_id=update.chat_id, text=data["text"])
-                        print(f"joke_handler failed: {exc}")
-
-@app.on_update(filters.group() & filters.text("چالش"))
+            await responses.answer(client, update, random.choice(BOT_TEXT_REPLIES), outbound.FUN)
+
+@group_router.text("جوک")
+async def joke_handler(client: BotClient, update: Update):
+    async with async_session() as session:
+        group = await fastpath.get_group_settings(session, update.chat_id)
+    if group is None:
+        return
+    text = await joke.feed.get()
+    if text is None:
+        return
+    await responses.answer(client, update, responses.text(text), outbound.FUN)
+
+@group_router.text("چالش")
 async def challenge_handler(client: BotClient, update: Update):
     async with async_session() as session:
-        group_result = await session.execute(select(models.Group).where(models.Group.chat_id == update.chat_id))
-        group = group_result.scalar_one_or_none()
+        group = await fastpath.get_group_settings(session, update.chat_id)
         if group:
-            question = await get_random_question()
+            question = await quiz.bank.random_question(update.chat_id)
             if question:
-                try:
-                    await client._make_request(
-                        "sendPoll", {
-                            "chat_id": update.chat_id,
-                            "question": question["question"],
-                            "options": question["options"],
-                            "reply_to_message_id": update.new_message.message_id,
-                            "type": "Quiz",
-                            "correct_option_index": question["correct_index"],
-                            "is_anonymous": False,
-                            "disable_notification": False,
-                            }
-                        )
-                
-                except Exception:
-                    await client._make_request(
-                    "sendPoll", {
+                await outbound.dispatcher.submit(
+                    client,
+                    outbound.FUN,
+                    update.chat_id,
+                    "sendPoll",
+                    {
                         "chat_id": update.chat_id,
-                        "question": question["question"],
-                        "options": question["options"],
+                        "question": question.question,
+                        "options": list(question.options),
+                        "reply_to_message_id": update.new_message.message_id,
                         "type": "Quiz",
-                        "correct_option_index": question["correct_index"],
+                        "correct_option_index": question.correct_index,
                         "is_anonymous": False,
                         "disable_notification": False,
-                        }
-                    )
+                    },
+                )
 
 @app.on_update(filters.private() & filters.commands("myid"))
 async def myid_handler(client: BotClient, update: Update):
-    try:
-        await update.reply(f"ID شما:\n{update.chat_id}")
-    except Exception:
-        await client.send_message(chat_id=update.chat_id, text=f"ID شما:\n{update.chat_id}")
+    await responses.answer(client, update, responses.text(f"ID شما:\n{update.chat_id}"))
+
+@app.on_update(filters.private() & filters.commands("language"))
+async def pv_language_handler(client: BotClient, update: Update):
+    parts = (update.new_message.text or "").split()
+    language = parts[1].lower() if len(parts) > 1 else None
+    if language not in catalog.languages:
+        async with async_session() as session:
+            current = await fastpath.get_user_language(session, update.chat_id)
+        message = get_string("language_unknown", current).format(languages=", ".join(catalog.languages))
+        return await responses.answer(client, update, responses.text(message))
+    user_buffer.add(chat_id=update.chat_id, user_id=update.new_message.sender_id, username=None)
+    await user_buffer.ensure_flushed(update.new_message.sender_id)
+    await writer.run(crud.set_user_language, update.chat_id, language)
+    message = get_string("language_set", language).format(language=get_string("language_name", language))
+    await responses.answer(client, update, responses.text(message))
 
 @app.on_update(filters.private() & filters.commands("broadcast"))
 async def broadcast_handler(client: BotClient, update: Update):
     message_text = (update.new_message.text or "").strip()
     parts = message_text.split(maxsplit=1)
     if len(parts) < 2 or not parts[1].strip():
-        try:
-            return await update.reply("لطفا پیام مورد نظر را بعد از دستور بنویسید.")
-        except Exception:
-            return await client.send_message(chat_id=update.chat_id, text="لطفا پیام مورد نظر را بعد از دستور بنویسید.")
+        return await responses.answer(client, update, BROADCAST_USAGE)
 
-    allowed_ids_env = os.getenv("BROADCAST_ALLOWED_IDS")
-    if allowed_ids_env:
-        allowed_ids = {item.strip() for item in allowed_ids_env.split(",") if item.strip()}
-        if str(update.chat_id) not in allowed_ids:
-            try:
-                return await update.reply("شما مجاز به استفاده از این دستور نیستید.")
-            except Exception:
-                return await client.send_message(chat_id=update.chat_id, text="شما مجاز به استفاده از این دستور نیستید.")
+    if not is_bot_admin(update.chat_id):
+        return await responses.answer(client, update, BROADCAST_NOT_ALLOWED)
 
     broadcast_text = parts[1].strip()
 
     async with async_session() as session:
-        result = await session.execute(select(models.Group.chat_id))
-        chat_ids = result.scalars().all()
+        result = await session.execute(select(models.Group.chat_id).limit(1))
+        has_groups = result.scalar_one_or_none() is not None
 
-    if not chat_ids:
-        try:
-            return await update.reply("هیچ گروهی برای ارسال پیام یافت نشد.")
-        except Exception:
-            return await client.send_message(chat_id=update.chat_id, text="هیچ گروهی برای ارسال پیام یافت نشد.")
+    if not has_groups:
+        return await responses.answer(client, update, BROADCAST_NO_GROUPS)
 
-    msg = None
-    try:
-        msg = await update.reply("در حال ارسال پیام...")
-    except Exception:
-        await client.send_message(chat_id=update.chat_id, text="در حال ارسال پیام...")
+    msg = await responses.answer(client, update, BROADCAST_STARTED, wait=True)
 
-    sent_count = 0
-    failed_count = 0
+    job = await writer.run(
+        crud.create_broadcast_job,
+        requester_id=update.chat_id,
+        text=broadcast_text,
+        progress_message_id=(msg.message_id or msg.new_message_id) if msg else None,
+    )
+    spawn_broadcast_job(client, job)
+
+@app.on_update(filters.private() & filters.commands("stats"))
+async def stats_handler(client: BotClient, update: Update):
+    if not is_bot_admin(update.chat_id):
+        return await responses.answer(client, update, BROADCAST_NOT_ALLOWED)
+    # Counted but not yet flushed updates are written first, so the numbers are current.
+    await stats.flush()
+    day = stats.day
+    async with async_session() as session:
+        today, total = await rollup.get_dashboard(session, day)
+    commands = sorted(
+        ((name.removeprefix("handler:"), value) for name, value in today.items() if name.startswith("handler:")),
+        key=lambda item: -item[1],
+    )
+    message = STATS_MESSAGE.format(
+        day=day,
+        installs_today=today.get("installs", 0),
+        active_groups=today.get(rollup.ACTIVE_GROUPS, 0),
+        deletes_today=today.get("deletes", 0),
+        bans_today=today.get("bans", 0),
+        installs_total=total.get("installs", 0),
+        deletes_total=total.get("deletes", 0),
+        bans_total=total.get("bans", 0),
+        commands="\n".join(f"{name}: {value}" for name, value in commands[:5]) or "ندارد",
+    )
+    await responses.answer(client, update, responses.text(message))
+
+def spawn_broadcast_job(client: BotClient, job: models.BroadcastJob):
+    # Runs outside the chat's worker shard so a long broadcast doesn't hold up that shard.
+    task = asyncio.create_task(run_broadcast_job(client, job))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def run_broadcast_job(client: BotClient, job: models.BroadcastJob):
+    async def report_progress(progress: broadcast.Progress):
+        # Queued behind the broadcast's own sends, so progress reports never take budget from admin replies.
+        await responses.edit_text(
+            client,
+            job.requester_id,
+            job.progress_message_id,
+            responses.text(
+                f"در حال ارسال پیام...\n\nارسال برای {progress.sent} گروه انجام شد.\n\nارسال برای {progress.failed} گروه ناموفق بود."
+            ),
+            outbound.BROADCAST,
+        )
 
-    for chat_id in chat_ids:
-        try:
-            await client.send_message(chat_id=chat_id, text=broadcast_text)
-            sent_count += 1
-        except Exception as exc:
-            failed_count += 1
-            print(f"Broadcast failed for {chat_id}: {exc}")
-        
+    try:
+        progress = await broadcast.run_job(client, job, on_progress=report_progress if job.progress_message_id else None)
+    except Exception as exc:
+        print(f"Broadcast job {job.id} failed: {exc}")
         try:
-            if msg:
-                await msg.edit_text(new_text=f"در حال ارسال پیام...\n\nارسال برای {sent_count} گروه انجام شد.\n\nارسال برای {failed_count} گروه ناموفق بود.")
-        except Exception as exc:
-            print(f"Failed to edit broadcast message: {exc}")
+            await writer.run(crud.set_broadcast_job_status, job.id, "failed")
+        except Exception as status_exc:
+            # Left as running, the job resumes from its last checkpoint on the next start.
+            print(f"Failed to mark broadcast job {job.id} as failed: {status_exc}")
+        summary = "ارسال پیام به دلیل خطا متوقف شد."
+    else:
+        summary = f"پیام برای {progress.sent} گروه ارسال شد.\n\nارسال برای {progress.failed} گروه ناموفق بود."
+        if progress.failures:
+            summary += "\n\n" + "\n".join(f"{kind}: {count}" for kind, count in progress.failures.most_common())
 
     try:
-        if msg:
-            await msg.edit_text(new_text=f"پیام برای {sent_count} گروه ارسال شد.\n\nارسال برای {failed_count} گروه ناموفق بود.")
+        if job.progress_message_id:
+            await responses.edit_text(
+                client, job.requester_id, job.progress_message_id, responses.text(summary), outbound.BROADCAST, wait=True
+            )
         else:
-            await client.send_message(chat_id=update.chat_id, text=f"پیام برای {sent_count} گروه ارسال شد.\n\nارسال برای {failed_count} گروه ناموفق بود.")
+            await responses.send(client, job.requester_id, responses.text(summary), wait=True)
     except Exception as exc:
         print(f"Failed to edit broadcast message: {exc}")
 
+app.on_update(filters.group() & router.routed(group_router))(router.dispatch)
+app.middleware()(workers.dispatcher.middleware)
+register_metrics()
+
 if __name__ == "__main__":
-    app.run(
+    options = dict(
         webhook_url=os.getenv("WEBHOOK_URL"),
         path=os.getenv("WEBHOOK_PATH"),
         port=int(os.getenv("WEBHOOK_PORT"))
-    )
\ No newline at end of file
+    )
+    if supervisor.PROCESSES > 1:
+        supervisor.run(app, supervisor.PROCESSES, **options)
+    else:
+        app.run(**options)
\ No newline at end of file
@@ -0,0 +1,191 @@
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+from aiohttp import web
+from rubpy.bot import BotClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class HandlerStats:
+    __slots__ = ("latency", "errors", "sql", "api")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.sql = 0
+        self.api = 0
+
+
+class _Span:
+    # Counts land on the handler's stats directly, so sends that finish after the handler returns still count.
+    __slots__ = ("stats",)
+
+    def __init__(self, stats: HandlerStats):
+        self.stats = stats
+
+
+_span: ContextVar[_Span | None] = ContextVar("metrics_span", default=None)
+
+
+class Registry:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.handlers: dict[str, HandlerStats] = defaultdict(HandlerStats)
+        self.sql_total = 0
+        self.api_calls: dict[str, int] = defaultdict(int)
+        self.api_errors: dict[str, int] = defaultdict(int)
+        self.gauges: list[tuple[str, str, str, Callable[[], Iterable[tuple[dict, float]]]]] = []
+        self.histograms: list[tuple[str, str, Callable[[], Iterable[tuple[dict, Histogram]]]]] = []
+
+    @asynccontextmanager
+    async def track(self, handler: str):
+        stats = self.handlers[handler]
+        token = _span.set(_Span(stats))
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.latency.observe(time.perf_counter() - started)
+            _span.reset(token)
+
+    def gauge(self, name: str, help: str, collect: Callable[[], Iterable[tuple[dict, float]]], kind: str = "gauge") -> None:
+        self.gauges.append((name, help, kind, collect))
+
+    def histogram(self, name: str, help: str, collect: Callable[[], Iterable[tuple[dict, Histogram]]]) -> None:
+        self.histograms.append((name, help, collect))
+
+    def record_sql(self, *args) -> None:
+        self.sql_total += 1
+        span = _span.get()
+        if span is not None:
+            span.stats.sql += 1
+
+    def instrument_engine(self, engine: AsyncEngine) -> None:
+        event.listen(engine.sync_engine, "before_cursor_execute", self.record_sql)
+
+    def instrument_client(self, client: BotClient) -> None:
+        make_request = client._make_request
+
+        async def counted(method: str, data: dict, **kwargs):
+            self.api_calls[method] += 1
+            span = _span.get()
+            if span is not None:
+                span.stats.api += 1
+            try:
+                return await make_request(method, data, **kwargs)
+            except Exception:
+                self.api_errors[method] += 1
+                raise
+
+        client._make_request = counted
+
+    def _render_histogram(self, lines: list[str], name: str, help: str, series: Iterable[tuple[dict, Histogram]]) -> None:
+        metric = f"{self.prefix}_{name}"
+        lines.append(f"# HELP {metric} {help}")
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, histogram in series:
+            label_text = "".join(f'{key}="{val}",' for key, val in labels.items())
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{metric}_bucket{{{label_text}le="{le}"}} {cumulative}')
+            label_text = label_text.rstrip(",")
+            lines.append(f"{metric}_sum{{{label_text}}} {histogram.total}")
+            lines.append(f"{metric}_count{{{label_text}}} {histogram.count}")
+
+    def render(self) -> str:
+        p = self.prefix
+        lines = []
+        self._render_histogram(
+            lines, "handler_seconds", "Handler latency.",
+            (({"handler": name}, stats.latency) for name, stats in sorted(self.handlers.items())),
+        )
+        for name, help, collect in self.histograms:
+            self._render_histogram(lines, name, help, collect())
+        for metric, help, attr in (
+            ("handler_errors_total", "Handler calls that raised.", "errors"),
+            ("handler_sql_statements_total", "SQL statements executed by handler.", "sql"),
+            ("handler_api_calls_total", "Outbound API calls made by handler.", "api"),
+        ):
+            lines.append(f"# HELP {p}_{metric} {help}")
+            lines.append(f"# TYPE {p}_{metric} counter")
+            for name, stats in sorted(self.handlers.items()):
+                lines.append(f'{p}_{metric}{{handler="{name}"}} {getattr(stats, attr)}')
+        lines.append(f"# HELP {p}_sql_statements_total SQL statements executed.")
+        lines.append(f"# TYPE {p}_sql_statements_total counter")
+        lines.append(f"{p}_sql_statements_total {self.sql_total}")
+        for metric, help, values in (
+            ("api_calls_total", "Outbound API calls by method.", self.api_calls),
+            ("api_errors_total", "Failed outbound API calls by method.", self.api_errors),
+        ):
+            lines.append(f"# HELP {p}_{metric} {help}")
+            lines.append(f"# TYPE {p}_{metric} counter")
+            for method, count in sorted(values.items()):
+                lines.append(f'{p}_{metric}{{method="{method}"}} {count}')
+        for name, help, kind, collect in self.gauges:
+            lines.append(f"# HELP {p}_{name} {help}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+            for labels, value in collect():
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{p}_{name}{{{label_text}}} {value}" if label_text else f"{p}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, registry: Registry, host: str, port: int):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: web.AppRunner | None = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self) -> None:
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Metrics served on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+registry = Registry(prefix="nion")
+server = MetricsServer(
+    registry,
+    host=os.getenv("METRICS_HOST", "0.0.0.0"),
+    port=int(os.getenv("METRICS_PORT", "8001")),
+)
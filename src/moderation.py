@@ -0,0 +1,47 @@
+import re
+
+from rubpy.bot import filters
+from rubpy.bot.models import Message, Update
+
+from database.cache import GroupSettings
+
+LINK_PATTERN = re.compile(r"(?i)\b((?:https?://|www\.)[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?)+(?:[/?#][^\s]*)?)")
+USERNAME_PATTERN = re.compile(r"(?i)(?<!\w)@(?:[a-z0-9_]{3,32})(?!\w)")
+
+FORWARD = 1
+LINK = 2
+USERNAME = 4
+
+
+def classify(message: Message) -> int:
+    flags = 0
+    if message.forwarded_from or message.forwarded_no_link:
+        flags |= FORWARD
+    text = message.text
+    if text:
+        if LINK_PATTERN.search(text):
+            flags |= LINK
+        if USERNAME_PATTERN.search(text):
+            flags |= USERNAME
+    return flags
+
+
+def locked(settings: GroupSettings) -> int:
+    flags = 0
+    if settings.forward_lock:
+        flags |= FORWARD
+    if settings.link_lock:
+        flags |= LINK
+    if settings.username_lock:
+        flags |= USERNAME
+    return flags
+
+
+class violation(filters.Filter):
+    async def check(self, update: Update) -> bool:
+        message = getattr(update, "new_message", None)
+        if message is None:
+            return False
+        flags = classify(message)
+        update.external_data["moderation"] = flags
+        return bool(flags)
@@ -0,0 +1,332 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import random
+import time
+from typing import Any
+
+from aiohttp import ClientError
+from rubpy.bot import BotClient
+from rubpy.bot.exceptions import APIException
+
+import metrics
+
+RETRYABLE_STATUSES = {"408", "425", "429", "500", "502", "503", "504", "TOO_REQUESTS"}
+
+# Send order: a lower value always goes out first.
+DELETE = 0
+ADMIN = 1
+BROADCAST = 2
+FUN = 3
+PRIORITIES = ("delete", "admin", "broadcast", "fun")
+
+# Per-chat limits apply to messages only; deletes spend just the global budget.
+MESSAGE_METHODS = frozenset({"sendMessage", "sendPoll"})
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_interval(cls, interval: float, capacity: float = 1.0) -> "TokenBucket":
+        return cls(1 / interval if interval > 0 else 0.0, capacity)
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def refund(self) -> None:
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class ChatLimiter:
+    """Token bucket per chat kept as a single theoretical-arrival time (GCRA)."""
+
+    def __init__(self, rate: float, burst: int):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.tolerance = self.interval * (max(1, burst) - 1)
+        self._arrivals: dict[str, float] = {}
+        self._prune_at = 1024
+
+    def delay(self, chat_id: str, now: float) -> float:
+        if not self.interval:
+            return 0.0
+        arrival = max(self._arrivals.get(chat_id, now), now)
+        wait = arrival - self.tolerance - now
+        if wait > 0:
+            return wait
+        self._arrivals[chat_id] = arrival + self.interval
+        if len(self._arrivals) > self._prune_at:
+            # Chats whose arrival time has passed have a full bucket; they need no entry.
+            self._arrivals = {chat: at for chat, at in self._arrivals.items() if at > now}
+            self._prune_at = max(1024, len(self._arrivals) * 2)
+        return 0.0
+
+    def __len__(self) -> int:
+        return len(self._arrivals)
+
+
+def classify_failure(exc: BaseException) -> tuple[str, bool]:
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout", True
+    if isinstance(exc, ClientError):
+        return "network", True
+    if isinstance(exc, APIException):
+        status = str(exc.status)
+        return f"api:{status}", status in RETRYABLE_STATUSES
+    return type(exc).__name__, False
+
+
+class Job:
+    __slots__ = (
+        "client", "priority", "chat_id", "method", "payload", "key",
+        "retries", "backoff", "attempt", "queued", "future", "context",
+    )
+
+    def __init__(self, client, priority, chat_id, method, payload, key, retries, backoff):
+        self.client = client
+        self.priority = priority
+        self.chat_id = chat_id
+        self.method = method
+        self.payload = payload
+        self.key = key
+        self.retries = retries
+        self.backoff = backoff
+        self.attempt = 0
+        self.queued = time.monotonic()
+        self.future: asyncio.Future | None = None
+        # The submitter's context, so the call is attributed to the handler that queued it.
+        self.context = contextvars.copy_context()
+
+
+class Outbound:
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        chats: ChatLimiter,
+        concurrency: int,
+        shed_at: int,
+        max_pending: int,
+        retries: int,
+        backoff: float,
+    ):
+        self.bucket = bucket
+        self.chats = chats
+        self.concurrency = max(1, concurrency)
+        self.shed_at = shed_at
+        self.max_pending = max_pending
+        self.retries = retries
+        self.backoff = backoff
+        self.queued = [0] * len(PRIORITIES)
+        self.sent = [0] * len(PRIORITIES)
+        self.failed = [0] * len(PRIORITIES)
+        self.retried = [0] * len(PRIORITIES)
+        self.dropped = [0] * len(PRIORITIES)
+        self.coalesced = [0] * len(PRIORITIES)
+        self.latency = [metrics.Histogram() for _ in PRIORITIES]
+        self._jobs: set[Job] = set()
+        self._keys: dict[Any, Job] = {}
+        self._seq = itertools.count()
+        self._queue: asyncio.PriorityQueue | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._idle: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        # Queued, waiting on a chat limit or a retry, or in flight.
+        return len(self._jobs)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.PriorityQueue()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        tasks = [self._task, *self._tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self._jobs:
+            if job.future is not None and not job.future.done():
+                job.future.cancel()
+        self._task = None
+        self._tasks.clear()
+        self._jobs.clear()
+        self._keys.clear()
+        self.queued = [0] * len(PRIORITIES)
+
+    async def join(self) -> None:
+        if self._idle is not None:
+            await self._idle.wait()
+
+    async def submit(
+        self,
+        client: BotClient,
+        priority: int,
+        chat_id: str,
+        method: str,
+        payload: dict,
+        *,
+        key: Any = None,
+        wait: bool = False,
+        retries: int | None = None,
+        backoff: float | None = None,
+    ) -> Any:
+        """Queue one API call. Returns its result when wait is set; None if dropped or fire-and-forget."""
+        overloaded = self.pending >= self.shed_at
+        job = self._keys.get(key) if key is not None and overloaded else None
+        if job is not None:
+            # Under overload, a message identical to one already pending for this chat is sent once.
+            self.coalesced[priority] += 1
+            if not wait:
+                return None
+            if job.future is None:
+                job.future = asyncio.get_running_loop().create_future()
+            return await job.future
+        if (priority == FUN and overloaded) or (priority == ADMIN and self.pending >= self.max_pending):
+            self.dropped[priority] += 1
+            return None
+        job = Job(
+            client, priority, chat_id, method, payload, key,
+            self.retries if retries is None else retries,
+            self.backoff if backoff is None else backoff,
+        )
+        if wait:
+            job.future = asyncio.get_running_loop().create_future()
+        if self._task is None:
+            return await self._inline(job)
+        self._jobs.add(job)
+        self._idle.clear()
+        if key is not None:
+            self._keys[key] = job
+        self._push(job)
+        return await job.future if job.future is not None else None
+
+    async def delete(self, client: BotClient, chat_id: str, message_id: str) -> None:
+        await self.submit(client, DELETE, chat_id, "deleteMessage", {"chat_id": chat_id, "message_id": str(message_id)})
+
+    def _push(self, job: Job) -> None:
+        self.queued[job.priority] += 1
+        self._queue.put_nowait((job.priority, next(self._seq), job))
+
+    def _later(self, delay: float, job: Job) -> None:
+        async def push() -> None:
+            await asyncio.sleep(delay)
+            self._push(job)
+
+        task = asyncio.create_task(push())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self) -> None:
+        while True:
+            # Wait for work without holding a token, then take whichever job ranks first once one is free.
+            self._queue.put_nowait(await self._queue.get())
+            await self._slots.acquire()
+            await self.bucket.acquire()
+            _, _, job = self._queue.get_nowait()
+            self.queued[job.priority] -= 1
+            if job.method in MESSAGE_METHODS:
+                wait = self.chats.delay(job.chat_id, time.monotonic())
+                if wait > 0:
+                    self.bucket.refund()
+                    self._slots.release()
+                    self._later(wait, job)
+                    continue
+            # Started inside the submitter's context; create_task(context=...) needs Python 3.11.
+            task = job.context.run(asyncio.create_task, self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job: Job) -> None:
+        try:
+            delay = await self._attempt(job)
+        finally:
+            self._slots.release()
+        if delay is not None:
+            self._later(delay, job)
+            return
+        self._jobs.discard(job)
+        if job.key is not None and self._keys.get(job.key) is job:
+            del self._keys[job.key]
+        if not self._jobs:
+            self._idle.set()
+
+    async def _inline(self, job: Job) -> Any:
+        while True:
+            await self.bucket.acquire()
+            delay = await self._attempt(job)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        return job.future.result() if job.future is not None else None
+
+    async def _attempt(self, job: Job) -> float | None:
+        """Makes one call; returns the delay before the next try, or None once the job is settled."""
+        if job.queued:
+            self.latency[job.priority].observe(time.monotonic() - job.queued)
+            job.queued = 0.0
+        try:
+            result = await job.client._make_request(job.method, job.payload)
+        except Exception as exc:
+            kind, retryable = classify_failure(exc)
+            if not retryable and "reply_to_message_id" in job.payload:
+                # Usually the message being answered is gone; send it once more as a plain message.
+                job.payload = {k: v for k, v in job.payload.items() if k != "reply_to_message_id"}
+                self.retried[job.priority] += 1
+                return 0.0
+            if retryable and job.attempt < job.retries:
+                job.attempt += 1
+                self.retried[job.priority] += 1
+                return job.backoff * 2 ** (job.attempt - 1) * (0.5 + random.random())
+            self.failed[job.priority] += 1
+            if job.future is not None:
+                if not job.future.done():
+                    job.future.set_exception(exc)
+            else:
+                print(f"{job.method} to {job.chat_id} failed ({kind}): {exc}")
+            return None
+        self.sent[job.priority] += 1
+        if job.future is not None and not job.future.done():
+            job.future.set_result(result)
+        return None
+
+
+dispatcher = Outbound(
+    bucket=TokenBucket.from_interval(
+        float(os.getenv("RATE_LIMIT") or 0),
+        capacity=float(os.getenv("OUTBOUND_BURST", "1")),
+    ),
+    chats=ChatLimiter(
+        rate=float(os.getenv("OUTBOUND_CHAT_RATE", "1")),
+        burst=int(os.getenv("OUTBOUND_CHAT_BURST", "5")),
+    ),
+    concurrency=int(os.getenv("OUTBOUND_CONCURRENCY", "16")),
+    shed_at=int(os.getenv("OUTBOUND_SHED_AT", "200")),
+    max_pending=int(os.getenv("OUTBOUND_MAX_PENDING", "1000")),
+    retries=int(os.getenv("OUTBOUND_RETRIES", "3")),
+    backoff=float(os.getenv("OUTBOUND_BACKOFF", "0.5")),
+)
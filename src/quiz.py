@@ -0,0 +1,103 @@
+import json
+import math
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import aiosqlite
+
+
+class Question(NamedTuple):
+    question: str
+    options: tuple[str, ...]
+    correct_index: int
+
+
+class _Cursor:
+    __slots__ = ("size", "step", "offset", "position")
+
+    def __init__(self, size: int):
+        # An affine walk (offset + step * i) mod size with gcd(step, size) == 1
+        # visits every question exactly once before the group sees a repeat.
+        step = 1
+        if size > 2:
+            step = random.randrange(1, size)
+            while math.gcd(step, size) != 1:
+                step = random.randrange(1, size)
+        self.size = size
+        self.step = step
+        self.offset = random.randrange(size)
+        self.position = 0
+
+    def next(self) -> int:
+        index = (self.offset + self.step * self.position) % self.size
+        self.position += 1
+        return index
+
+
+class QuestionBank:
+    def __init__(self, path: str, reload_interval: float, max_cursors: int):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.max_cursors = max_cursors
+        self.questions: tuple[Question, ...] = ()
+        self._mtime: float | None = None
+        self._checked_at = 0.0
+        self._cursors: OrderedDict[str, _Cursor] = OrderedDict()
+
+    async def load(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self.questions = ()
+            self._mtime = None
+            return
+        questions = []
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute("SELECT question, options, answer FROM questions;") as cursor:
+                async for question, options_json, answer in cursor:
+                    try:
+                        options_data = json.loads(options_json)
+                        options = tuple(option["title"] for option in options_data)
+                        correct_index = [option["id"] for option in options_data].index(answer)
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    questions.append(Question(question.strip(), options, correct_index))
+        self.questions = tuple(questions)
+        self._mtime = mtime
+        self._cursors.clear()
+
+    async def reload_if_changed(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            await self.load()
+
+    async def random_question(self, chat_id: str) -> Question | None:
+        await self.reload_if_changed()
+        size = len(self.questions)
+        if not size:
+            return None
+        cursor = self._cursors.get(chat_id)
+        if cursor is None or cursor.size != size or cursor.position >= size:
+            cursor = self._cursors[chat_id] = _Cursor(size)
+        # Least recently quizzed groups go first; an evicted group just starts a fresh walk.
+        self._cursors.move_to_end(chat_id)
+        while len(self._cursors) > self.max_cursors:
+            self._cursors.popitem(last=False)
+        return self.questions[cursor.next()]
+
+
+bank = QuestionBank(
+    path=os.getenv("QUIZ_DB_PATH", "quiz.db"),
+    reload_interval=float(os.getenv("QUIZ_RELOAD_INTERVAL", "30")),
+    max_cursors=int(os.getenv("QUIZ_CURSOR_CACHE_SIZE", "10000")),
+)
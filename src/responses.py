@@ -0,0 +1,158 @@
+import dataclasses
+import functools
+import os
+from typing import Any
+
+from rubpy.bot import BotClient
+from rubpy.bot.enums import ChatKeypadTypeEnum
+from rubpy.bot.models import Keypad, MessageId, Update
+from rubpy.parser.markdown import MARKDOWN_RE, Markdown
+
+import outbound
+from keyboard import start
+from strings import catalog, placeholders
+
+# The client's default parse mode is Markdown; static texts are converted once here instead of per send.
+_markdown = Markdown()
+
+
+class Reply:
+    """A sendMessage payload minus the chat, serialized once and shared by every send."""
+
+    __slots__ = ("payload",)
+
+    def __init__(
+        self,
+        text: str,
+        chat_keypad: Keypad | None = None,
+        chat_keypad_type: ChatKeypadTypeEnum = ChatKeypadTypeEnum.NONE,
+    ):
+        self.payload = {
+            "disable_notification": False,
+            "chat_keypad_type": chat_keypad_type.value,
+        }
+        _format(self.payload, text)
+        if chat_keypad:
+            self.payload["chat_keypad"] = dataclasses.asdict(chat_keypad)
+
+    def with_text(self, text: str) -> "Reply":
+        # The serialized keypad is shared, not copied; payloads are never mutated after build.
+        reply = Reply.__new__(Reply)
+        reply.payload = {**self.payload}
+        reply.payload.pop("metadata", None)
+        _format(reply.payload, text)
+        return reply
+
+    def with_inline_keypad(self, inline_keypad: Keypad | None) -> "Reply":
+        reply = Reply.__new__(Reply)
+        reply.payload = {**self.payload}
+        if inline_keypad:
+            reply.payload["inline_keypad"] = dataclasses.asdict(inline_keypad)
+        else:
+            reply.payload.pop("inline_keypad", None)
+        return reply
+
+    def build(self, chat_id: str, reply_to: str | None = None) -> dict:
+        payload = {**self.payload, "chat_id": chat_id}
+        if reply_to:
+            payload["reply_to_message_id"] = str(reply_to)
+        return payload
+
+
+@functools.lru_cache(maxsize=int(os.getenv("REPLY_METADATA_CACHE_SIZE", "1024")))
+def _metadata(text: str) -> dict:
+    # Shared by every payload built from the same text, like the serialized keypads.
+    if MARKDOWN_RE.search(text) is None:
+        # No markup: skip the parser's per-character offset table; it would only strip the text.
+        return {"text": text.strip()}
+    return _markdown.to_metadata(text)
+
+
+def _format(payload: dict, text: str) -> None:
+    payload["text"] = text
+    if text:
+        payload.update(_metadata(text))
+
+
+PLAIN = Reply("")
+
+# Every placeholder-free string of every locale, plus the start keypad per locale, built at import.
+_static: dict[str, dict[str, Reply]] = {
+    language: {key: Reply(text) for key, text in strings.items() if not placeholders(text)}
+    for language, strings in catalog.locales.items()
+}
+_start_menu: dict[str, Reply] = {
+    language: Reply("", start.get_keyboard(language), ChatKeypadTypeEnum.NEW)
+    for language in catalog.languages
+}
+
+
+def static(key: str, language: str | None = None) -> Reply:
+    return _static.get(language or catalog.default, _static[catalog.default])[key]
+
+
+def text(message: str) -> Reply:
+    return PLAIN.with_text(message)
+
+
+def start_menu(message: str, language: str | None = None) -> Reply:
+    return _start_menu.get(language or catalog.default, _start_menu[catalog.default]).with_text(message)
+
+
+async def send(
+    client: BotClient,
+    chat_id: str,
+    reply: Reply,
+    reply_to: str | None = None,
+    *,
+    priority: int = outbound.ADMIN,
+    key: Any = None,
+    wait: bool = False,
+) -> MessageId | None:
+    # The payload is already formatted, so it goes to the API as is, skipping send_message's per-call work.
+    result = await outbound.dispatcher.submit(
+        client, priority, chat_id, "sendMessage", reply.build(chat_id, reply_to), key=key, wait=wait
+    )
+    if result is None:
+        return None
+    result["chat_id"] = chat_id
+    result["client"] = client
+    return MessageId(**result)
+
+
+async def answer(
+    client: BotClient, update: Update, reply: Reply, priority: int = outbound.ADMIN, wait: bool = False
+) -> MessageId | None:
+    # Under overload, identical texts still waiting to go out to the same chat are sent once.
+    key = (update.chat_id, reply.payload["text"])
+    return await send(client, update.chat_id, reply, update.message_id, priority=priority, key=key, wait=wait)
+
+
+async def edit_text(
+    client: BotClient, chat_id: str, message_id: str, reply: Reply, priority: int = outbound.ADMIN, *, wait: bool = False
+) -> Any:
+    payload = {key: reply.payload[key] for key in ("text", "metadata") if key in reply.payload}
+    return await outbound.dispatcher.submit(
+        client,
+        priority,
+        chat_id,
+        "editMessageText",
+        {**payload, "chat_id": chat_id, "message_id": str(message_id)},
+        wait=wait,
+    )
+
+
+async def edit(client: BotClient, chat_id: str, message_id: str, reply: Reply, priority: int = outbound.ADMIN) -> None:
+    """Replaces the text and inline keypad of a sent message; chat keypads cannot be edited."""
+    await edit_text(client, chat_id, message_id, reply, priority)
+    await outbound.dispatcher.submit(
+        client,
+        priority,
+        chat_id,
+        "editMessageKeypad",
+        {
+            "chat_id": chat_id,
+            "message_id": str(message_id),
+            "inline_keypad": reply.payload.get("inline_keypad", {"rows": []}),
+        },
+    )
@@ -0,0 +1,121 @@
+import re
+from typing import Callable
+
+from rubpy.bot import filters
+from rubpy.bot.models import Update
+
+import metrics
+
+# Returned by a guard's handler that lets the message through to the later guards and the commands.
+PASS = object()
+
+
+class _Node:
+    __slots__ = ("children", "routes")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.routes: list[tuple[re.Pattern, Callable]] = []
+
+
+class CommandRouter:
+    def __init__(self):
+        self.exact: dict[str, Callable] = {}
+        self.root = _Node()
+        self.scanners: list[tuple[filters.Filter, Callable]] = []
+        self.guards: list[tuple[filters.Filter, Callable]] = []
+
+    def text(self, command: str) -> Callable:
+        def decorator(handler: Callable) -> Callable:
+            self.exact[command] = handler
+            return handler
+        return decorator
+
+    def prefix(self, prefix: str, pattern: re.Pattern) -> Callable:
+        def decorator(handler: Callable) -> Callable:
+            node = self.root
+            for char in prefix:
+                node = node.children.setdefault(char, _Node())
+            node.routes.append((pattern, handler))
+            return handler
+        return decorator
+
+    def guard(self, check: filters.Filter) -> Callable:
+        """Like scan(), but checked before commands; the handler returns PASS to hand the message on.
+
+        Guard checks run for every group message, so they must not do I/O; lookups go in the handler.
+        """
+        def decorator(handler: Callable) -> Callable:
+            self.guards.append((check, handler))
+            return handler
+        return decorator
+
+    def scan(self, check: filters.Filter) -> Callable:
+        def decorator(handler: Callable) -> Callable:
+            self.scanners.append((check, handler))
+            return handler
+        return decorator
+
+    def match_prefix(self, text: str) -> tuple[Callable, re.Match] | None:
+        node = self.root
+        candidates = []
+        for char in text:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.routes:
+                candidates.append(node.routes)
+        # Longest registered prefix wins; its pattern still has to accept the whole message.
+        for routes in reversed(candidates):
+            for pattern, handler in routes:
+                match = pattern.match(text.strip())
+                if match:
+                    return handler, match
+        return None
+
+    async def resolve(self, update: Update, first_guard: int = 0) -> Callable | None:
+        for index in range(first_guard, len(self.guards)):
+            check, handler = self.guards[index]
+            if await check.check(update):
+                update.external_data["next_guard"] = index + 1
+                return handler
+        message = getattr(update, "new_message", None)
+        text = message.text if message else None
+        if text:
+            handler = self.exact.get(text)
+            if handler is not None:
+                return handler
+            routed = self.match_prefix(text)
+            if routed is not None:
+                handler, match = routed
+                update.external_data["match"] = match
+                return handler
+        for check, handler in self.scanners:
+            if await check.check(update):
+                return handler
+        return None
+
+
+class routed(filters.Filter):
+    def __init__(self, router: CommandRouter):
+        self.router = router
+
+    async def check(self, update: Update) -> bool:
+        handler = await self.router.resolve(update)
+        if handler is None:
+            return False
+        update.external_data["route"] = handler
+        update.external_data["router"] = self.router
+        return True
+
+
+async def dispatch(client, update: Update):
+    result = await update.external_data["route"](client, update)
+    while result is PASS:
+        # A guard let the message through: route it on as if that guard had not matched.
+        handler = await update.external_data["router"].resolve(update, update.external_data["next_guard"])
+        if handler is None:
+            return
+        update.external_data["route"] = handler
+        async with metrics.registry.track(handler.__name__):
+            result = await handler(client, update)
@@ -1,8 +1,60 @@
 import json
+import os
+from pathlib import Path
+from string import Formatter
 
-with open("src/string.json", "r", encoding="utf-8") as f:
-    strings = json.load(f)
+STRINGS_DIR = Path(__file__).resolve().parent
+# string.json holds the complete Persian catalogue; string.<code>.json files translate over it.
+BASE_LANGUAGE = "fa"
+DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", BASE_LANGUAGE)
 
 
-def get_string(key: str) -> str:
-    return strings.get(key, "")
+def placeholders(text: str) -> frozenset[str]:
+    return frozenset(field for _, field, _, _ in Formatter().parse(text) if field is not None)
+
+
+def _load(path: Path) -> dict[str, str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Catalog:
+    def __init__(self, directory: Path, default: str, base: str = BASE_LANGUAGE):
+        self.base = base
+        raw = {base: _load(directory / "string.json")}
+        for path in sorted(directory.glob("string.*.json")):
+            language = path.name.split(".")[1]
+            raw[language] = {**raw.get(language, {}), **_load(path)}
+        self._validate(raw)
+        if default not in raw:
+            raise ValueError(f"no string catalog for the default language {default!r}")
+        # The fallback for chats without a language; every locale still fills its gaps from the base.
+        self.default = default
+        complete = raw[base]
+        # Every locale is merged over the base once here, so a lookup is always two dict hits.
+        self.locales: dict[str, dict[str, str]] = {
+            language: {**complete, **strings} for language, strings in raw.items()
+        }
+        self.languages = tuple(self.locales)
+
+    def _validate(self, raw: dict[str, dict[str, str]]) -> None:
+        complete = raw[self.base]
+        problems = []
+        for language, strings in raw.items():
+            for key, text in strings.items():
+                if key not in complete:
+                    problems.append(f"{language}: unknown key {key!r}")
+                elif placeholders(text) != placeholders(complete[key]):
+                    problems.append(f"{language}: placeholders of {key!r} differ from {self.base}")
+        if problems:
+            raise ValueError("invalid string catalog:\n" + "\n".join(problems))
+
+    def get(self, key: str, language: str | None = None) -> str:
+        return self.locales.get(language or self.default, self.locales[self.default]).get(key, "")
+
+
+catalog = Catalog(STRINGS_DIR, DEFAULT_LANGUAGE)
+
+
+def get_string(key: str, language: str | None = None) -> str:
+    return catalog.get(key, language)
@@ -0,0 +1,281 @@
+import asyncio
+import bisect
+import dataclasses
+import enum
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import zlib
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+from rubpy.bot import BotClient
+from rubpy.bot.models import InlineMessage, Update
+
+import metrics
+import outbound
+import workers
+from database import cache, engine, init_db
+from database.config import read_engine
+
+PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+DRAIN_TIMEOUT = float(os.getenv("WORKER_DRAIN_TIMEOUT", "10"))
+# Points per worker on the hash ring; at 256 no worker gets much over 10% more than its share of chats.
+REPLICAS = 256
+
+# This process's place among the workers; None when the bot runs as a single process.
+worker_index: int | None = None
+
+_HEADER = struct.Struct("!I")
+
+
+class HashRing:
+    """Consistent hashing of chat ids onto workers: changing the worker count moves only about 1/n of the chats."""
+
+    def __init__(self, nodes: int, replicas: int = REPLICAS):
+        # crc32 of labels this alike clusters; the points use a real hash, lookups stay on the cheap one.
+        points = sorted(
+            (int.from_bytes(hashlib.blake2b(f"worker-{node}:{replica}".encode(), digest_size=4).digest(), "big"), node)
+            for node in range(nodes)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> int:
+        index = bisect.bisect(self._hashes, zlib.crc32(key.encode()))
+        return self._nodes[index if index < len(self._nodes) else 0]
+
+
+def _encode(value: Any) -> Any:
+    if dataclasses.is_dataclass(value):
+        return {field.name: getattr(value, field.name) for field in dataclasses.fields(value) if field.name != "client"}
+    if isinstance(value, enum.Enum):
+        return value.value
+    raise TypeError(f"cannot send {type(value).__name__} to a worker")
+
+
+class Link:
+    """Length-prefixed JSON frames over one end of a unix socket pair."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, sock: socket.socket) -> "Link":
+        reader, writer = await asyncio.open_unix_connection(sock=sock)
+        return cls(reader, writer)
+
+    def send(self, message: list) -> None:
+        if self.writer.is_closing():
+            return
+        data = json.dumps(message, ensure_ascii=False, separators=(",", ":"), default=_encode).encode()
+        self.writer.write(_HEADER.pack(len(data)) + data)
+
+    async def drain(self) -> None:
+        await self.writer.drain()
+
+    async def receive(self) -> list | None:
+        try:
+            (size,) = _HEADER.unpack(await self.reader.readexactly(_HEADER.size))
+            return json.loads(await self.reader.readexactly(size))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    def finish(self) -> None:
+        # Half-closes the socket: the other side reads EOF but can still answer.
+        if not self.writer.is_closing():
+            self.writer.write_eof()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def _raw(update: dict | Update | InlineMessage) -> dict:
+    if isinstance(update, InlineMessage):
+        # Webhook inline messages arrive already parsed; rebuild the item getUpdates would have returned.
+        return {
+            "type": "InlineMessage",
+            "chat_id": update.chat_id,
+            "sender_id": update.sender_id,
+            "text": update.text,
+            "message_id": update.message_id,
+            "file": update.file,
+            "location": update.location,
+            "aux_data": update.aux_data,
+        }
+    return update
+
+
+class Forwarder(BotClient):
+    """Receives updates like the bot does (polling or webhook) and hands each raw one to the worker owning its chat."""
+
+    def __init__(self, links: list[Link], ring: HashRing, **kwargs):
+        super().__init__(**kwargs)
+        self.links = links
+        self.ring = ring
+        self.forwarded = [0] * len(links)
+
+    def _parse_update(self, item: dict) -> dict | None:
+        # Workers parse the update themselves; the supervisor only needs its chat id.
+        return item if item.get("type") else None
+
+    async def process_update(self, update: dict | InlineMessage) -> None:
+        item = _raw(update)
+        node = self.ring.node_for(str(item.get("chat_id") or ""))
+        link = self.links[node]
+        link.send(["update", item])
+        self.forwarded[node] += 1
+        # A worker that falls behind holds back the poller instead of piling updates up in memory.
+        await link.drain()
+
+
+def spawn(app: BotClient, processes: int) -> tuple[list[socket.socket], list[BaseProcess]]:
+    """Forks the workers; returns the supervisor's end of each worker's link, and the processes."""
+    context = multiprocessing.get_context("fork")
+    pairs = [socket.socketpair() for _ in range(processes)]
+    children = []
+    for index, (_, child_end) in enumerate(pairs):
+        inherited = [sock for pair in pairs for sock in pair if sock is not child_end]
+        process = context.Process(
+            target=_worker, args=(app, index, processes, child_end, inherited), name=f"worker-{index}"
+        )
+        process.start()
+        children.append(process)
+    for _, child_end in pairs:
+        child_end.close()
+    return [parent_end for parent_end, _ in pairs], children
+
+
+def reap(children: list[BaseProcess]) -> None:
+    for process in children:
+        process.join(DRAIN_TIMEOUT + 5)
+        if process.is_alive():
+            print(f"{process.name} did not stop in time, terminating it")
+            process.terminate()
+            process.join()
+
+
+def run(app: BotClient, processes: int, **options) -> None:
+    """Runs `processes` forked copies of the bot, each owning a share of the chats, behind one update receiver."""
+    # Migrate once here rather than racing in every worker; the pools are closed again before forking.
+    asyncio.run(migrate())
+    sockets, children = spawn(app, processes)
+    failed = False
+    try:
+        failed = asyncio.run(_supervise(app, sockets, options))
+    finally:
+        reap(children)
+    if failed:
+        raise SystemExit(1)
+
+
+async def migrate() -> None:
+    await init_db()
+    await engine.dispose()
+    await read_engine.dispose()
+
+
+async def _supervise(app: BotClient, sockets: list[socket.socket], options: dict) -> bool:
+    """Forwards updates until a signal or a worker exit; returns True if a worker died."""
+    links = [await Link.open(sock) for sock in sockets]
+    forwarder = Forwarder(
+        links,
+        HashRing(len(links)),
+        token=app.token,
+        rate_limit=0,
+        max_retries=app.max_retries,
+        use_webhook=app.use_webhook,
+    )
+    stopping = asyncio.Event()
+    failed = False
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    async def relay(index: int) -> None:
+        nonlocal failed
+        while (message := await links[index].receive()) is not None:
+            if message[0] == "ready":
+                print(f"worker {index} ready")
+                continue
+            # Cache invalidations go to every other worker.
+            for other, link in enumerate(links):
+                if other != index:
+                    link.send(message)
+        if not stopping.is_set():
+            print(f"worker {index} exited unexpectedly, shutting down")
+            failed = True
+            stopping.set()
+
+    relays = [asyncio.create_task(relay(index)) for index in range(len(links))]
+    receiver = asyncio.create_task(forwarder.run(**options))
+    await asyncio.wait([receiver, asyncio.create_task(stopping.wait())], return_when=asyncio.FIRST_COMPLETED)
+    stopping.set()
+    receiver.cancel()
+    await asyncio.gather(receiver, return_exceptions=True)
+    await forwarder.stop()
+    # EOF on its link is a worker's cue to finish what it has and shut down; its own EOF follows.
+    for link in links:
+        link.finish()
+    await asyncio.gather(*relays, return_exceptions=True)
+    for link in links:
+        link.close()
+    print("updates forwarded per worker:", forwarder.forwarded)
+    return failed
+
+
+def _worker(app: BotClient, index: int, count: int, sock: socket.socket, inherited: list[socket.socket]) -> None:
+    # The other workers' sockets came along with the fork; holding them would keep those links from closing.
+    for other in inherited:
+        other.close()
+    # Signals reach the whole process group; the supervisor stops workers in order by closing their links.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_serve(app, index, count, sock))
+
+
+async def _serve(app: BotClient, index: int, count: int, sock: socket.socket) -> None:
+    global worker_index
+    worker_index = index
+    # The token's request budget is shared by all workers.
+    outbound.dispatcher.bucket.rate /= count
+    if metrics.server.port:
+        metrics.server.port += index
+    link = await Link.open(sock)
+    cache.peers = link.send
+    await app.start()
+    link.send(["ready", index])
+    tasks: set[asyncio.Task] = set()
+    try:
+        while (message := await link.receive()) is not None:
+            kind = message[0]
+            if kind == "update":
+                update = app._parse_update(message[1])
+                if update is not None:
+                    task = asyncio.create_task(app.process_update(update))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            elif kind == "invalidate":
+                cache.stores[message[1]].invalidate(message[2])
+            elif kind == "clear":
+                cache.stores[message[1]].clear()
+    finally:
+        cache.peers = None
+        try:
+            await asyncio.wait_for(_drain(tasks), DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"worker {index}: updates still running after {DRAIN_TIMEOUT}s, stopping anyway")
+        await app.stop()
+        link.close()
+
+
+async def _drain(tasks: set[asyncio.Task]) -> None:
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await workers.dispatcher.join()
+    await outbound.dispatcher.join()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import zlib
+from typing import Callable
+
+from rubpy.bot import BotClient
+from rubpy.bot.models import InlineMessage, Update
+
+import metrics
+from database.rollup import stats
+
+
+class ShardedDispatcher:
+    def __init__(self, shards: int, queue_size: int, shed_at: int):
+        self.shards = shards
+        self.queue_size = queue_size
+        self.shed_at = shed_at
+        self.queues: list[asyncio.Queue] = []
+        self.dropped = 0
+        self._low_priority: set[Callable] = set()
+        self._space: list[asyncio.Event] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def low_priority(self, handler: Callable) -> Callable:
+        self._low_priority.add(handler)
+        return handler
+
+    def shard_for(self, chat_id: str) -> int:
+        # crc32 rather than hash(): str hashes are salted per process.
+        return zlib.crc32(chat_id.encode()) % self.shards
+
+    def depths(self) -> list[int]:
+        return [queue.qsize() for queue in self.queues]
+
+    def start(self, client: BotClient) -> None:
+        if self._tasks:
+            return
+        # Unbounded so an update is queued without suspending; queue_size is enforced in middleware().
+        self.queues = [asyncio.Queue() for _ in range(self.shards)]
+        self._space = [asyncio.Event() for _ in range(self.shards)]
+        self._tasks = [
+            asyncio.create_task(self._work(client, queue, space)) for queue, space in zip(self.queues, self._space)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.queues = []
+        self._space = []
+
+    async def join(self) -> None:
+        # Waits until every update already queued has been handled.
+        await asyncio.gather(*(queue.join() for queue in self.queues))
+
+    async def middleware(self, client: BotClient, update: Update | InlineMessage, call_next: Callable):
+        if not self._tasks:
+            return await call_next()
+        if isinstance(update, Update) and client._extract_message_id(update):
+            key = client._extract_update_key(update)
+            if key in client.processed_messages:
+                return
+            client.processed_messages.append(key)
+        if isinstance(update, Update) and str(update.chat_id).startswith("g0"):
+            stats.active(update.chat_id)
+
+        # Nothing above suspends, so a chat's updates reach its shard in the order they arrived;
+        # handlers are resolved by the shard worker, where lookups can't reorder them.
+        index = self.shard_for(str(update.chat_id))
+        queue = self.queues[index]
+        queue.put_nowait(update)
+        # A full shard still holds back the poller / webhook task, once its update has its place.
+        while queue.qsize() > self.queue_size:
+            space = self._space[index]
+            space.clear()
+            await space.wait()
+
+    async def _resolve(self, client: BotClient, update: Update | InlineMessage) -> Callable | None:
+        for handler_list in client.handlers.values():
+            for handler_filters, handler in handler_list:
+                if await client._filters_pass(update, handler_filters):
+                    return handler
+        return None
+
+    def _is_low_priority(self, update: Update | InlineMessage, handler: Callable) -> bool:
+        route = getattr(update, "external_data", {}).get("route", handler)
+        return route in self._low_priority or handler in self._low_priority
+
+    async def _work(self, client: BotClient, queue: asyncio.Queue, space: asyncio.Event) -> None:
+        while True:
+            update = await queue.get()
+            if queue.qsize() <= self.queue_size:
+                space.set()
+            try:
+                await self._handle(client, queue, update)
+            finally:
+                queue.task_done()
+
+    async def _handle(self, client: BotClient, queue: asyncio.Queue, update: Update | InlineMessage) -> None:
+        try:
+            handler = await self._resolve(client, update)
+        except Exception as exc:
+            print(f"resolving an update failed: {exc}")
+            return
+        if handler is None:
+            return
+        if queue.qsize() >= self.shed_at and self._is_low_priority(update, handler):
+            self.dropped += 1
+            return
+        route = getattr(update, "external_data", {}).get("route", handler)
+        try:
+            async with metrics.registry.track(route.__name__):
+                await handler(client, update)
+            stats.add(f"handler:{route.__name__}")
+        except Exception as exc:
+            print(f"{route.__name__} failed: {exc}")
+
+dispatcher = ShardedDispatcher(
+    shards=int(os.getenv("WORKER_SHARDS", "16")),
+    queue_size=int(os.getenv("WORKER_QUEUE_SIZE", "100")),
+    shed_at=int(os.getenv("WORKER_SHED_AT", "50")),
+)
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+# The bot's modules read these at import; a throwaway database keeps the tests off any real one.
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("RATE_LIMIT", "0")
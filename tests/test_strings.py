@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+from strings import STRINGS_DIR, Catalog
+
+
+def read(name: str) -> dict[str, str]:
+    with open(STRINGS_DIR / name, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_english_default_keeps_the_persian_catalogue():
+    catalog = Catalog(STRINGS_DIR, "en")
+    persian, english = read("string.json"), read("string.en.json")
+    assert set(catalog.languages) == {"fa", "en"}
+    assert catalog.get("gp_install", "fa") == persian["gp_install"]
+    assert catalog.get("gp_install", "en") == english["gp_install"]
+    # Chats without a language, or with one that has no catalogue, get the default.
+    assert catalog.get("gp_install") == english["gp_install"]
+    assert catalog.get("gp_install", "de") == english["gp_install"]
+
+
+def test_persian_default():
+    catalog = Catalog(STRINGS_DIR, "fa")
+    assert set(catalog.languages) == {"fa", "en"}
+    assert catalog.get("gp_install") == read("string.json")["gp_install"]
+
+
+def test_unknown_default_is_rejected():
+    with pytest.raises(ValueError):
+        Catalog(STRINGS_DIR, "de")
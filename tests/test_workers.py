@@ -0,0 +1,56 @@
+import asyncio
+import random
+
+from rubpy.bot import BotClient, filters
+from rubpy.bot.enums import UpdateTypeEnum
+from rubpy.bot.models import Message, Update
+
+from workers import ShardedDispatcher
+
+
+class SlowFilter(filters.Filter):
+    """Suspends for a random while, like a filter that looks something up."""
+
+    async def check(self, update: Update) -> bool:
+        await asyncio.sleep(random.uniform(0, 0.005))
+        return True
+
+
+def make_update(client: BotClient, chat_id: str, index: int) -> Update:
+    message = Message(message_id=f"{chat_id}-{index}", sender_id="u0user", time=str(index), text=str(index))
+    return Update(type=UpdateTypeEnum.NewMessage, chat_id=chat_id, new_message=message, client=client)
+
+
+async def deliver(queue_size: int) -> dict[str, list[int]]:
+    client = BotClient(token="test")
+    dispatcher = ShardedDispatcher(shards=2, queue_size=queue_size, shed_at=1000)
+    handled: dict[str, list[int]] = {}
+
+    async def handler(client: BotClient, update: Update):
+        await asyncio.sleep(0)
+        handled.setdefault(update.chat_id, []).append(int(update.new_message.text))
+
+    client.on_update(SlowFilter())(handler)
+    client.middleware()(dispatcher.middleware)
+    dispatcher.start(client)
+    chats = [f"g0chat{i}" for i in range(5)]
+    updates = [make_update(client, chat_id, index) for index in range(40) for chat_id in chats]
+    try:
+        # Like the poller: one batch of interleaved updates handed over concurrently.
+        await asyncio.gather(*(client.process_update(update) for update in updates))
+        await dispatcher.join()
+    finally:
+        await dispatcher.stop()
+    return handled
+
+
+def test_chat_updates_are_handled_in_arrival_order():
+    random.seed(1)
+    handled = asyncio.run(deliver(queue_size=100))
+    assert handled == {f"g0chat{i}": list(range(40)) for i in range(5)}
+
+
+def test_order_holds_when_shards_are_full():
+    random.seed(2)
+    handled = asyncio.run(deliver(queue_size=2))
+    assert handled == {f"g0chat{i}": list(range(40)) for i in range(5)}